@@ -29,6 +29,7 @@
         'account_voucher',
     ],
     "data": [
+        'security/ir.model.access.csv',
         'views/payment_order_view.xml',
     ],
     'installable': False,
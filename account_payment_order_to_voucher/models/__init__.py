@@ -4,3 +4,4 @@
 #
 
 from . import payment_order
+from . import payment_order_voucher_run
@@ -3,14 +3,101 @@
 #   See __openerp__.py about license
 #
 
+import logging
+import time
+from contextlib import contextmanager
+
 from openerp import models, fields, api, _
 from openerp.exceptions import Warning
 
+_logger = logging.getLogger(__name__)
+
+VOUCHER_RUN_PHASES = ('grouping', 'header', 'lines', 'create', 'link')
+
+
+@contextmanager
+def timed_phase(timings, phase):
+    start = time.time()
+    try:
+        yield
+    finally:
+        timings[phase] += time.time() - start
+
 
 class PaymentOrder(models.Model):
     _inherit = 'payment.order'
     voucher_ids = fields.Many2many(
         'account.voucher', string='Vouchers', readonly=True)
+    voucher_run_ids = fields.One2many(
+        'payment.order.voucher.run', 'order_id',
+        string='Voucher generation log', readonly=True)
+
+    @api.multi
+    def check_vouchers_generation(self, voucher_journals=None):
+        """Validate a batch of orders before any voucher is generated.
+
+        Every check is done for the whole batch at once, with one query
+        each, so that a long generation run is not interrupted by data
+        errors. voucher_journals is the result of _get_voucher_journals,
+        computed if not given.
+        Return a dictionary mapping order ids to the list of problems found;
+        orders that can be processed are not part of it.
+        """
+        report = {}
+        if not self:
+            return report
+        if voucher_journals is None:
+            voucher_journals = self._get_voucher_journals()
+        voucher_rel = self._fields['voucher_ids']
+        self.env.cr.execute(
+            "SELECT DISTINCT %s FROM %s WHERE %s IN %%s" % (
+                voucher_rel.column1, voucher_rel.relation,
+                voucher_rel.column1),
+            (tuple(self.ids), ))
+        for row in self.env.cr.fetchall():
+            order = self.browse(row[0])
+            report.setdefault(order.id, []).append(
+                _("Payment order %s already has vouchers") % order.reference)
+        for order in self.search([
+            ('id', 'in', self.ids), ('state', '!=', 'done'),
+        ]):
+            report.setdefault(order.id, []).append(
+                _("Payment order %s is not in 'done' state")
+                % order.reference)
+        for order in self.search([
+            ('id', 'in', self.ids),
+            ('mode.journal.default_debit_account_id', '=', False),
+        ]):
+            report.setdefault(order.id, []).append(
+                _("Journal of payment mode %s does not have a default "
+                  "debit account") % order.mode.name)
+        for (order_id, currency_id), journal in sorted(
+            voucher_journals.iteritems()
+        ):
+            if not journal:
+                order = self.browse(order_id)
+                currency = self.env['res.currency'].browse(currency_id)
+                report.setdefault(order.id, []).append(
+                    _("Payment order %s has lines in %s but no bank or "
+                      "cash journal in that currency")
+                    % (order.reference, currency.name))
+        return report
+
+    def _format_vouchers_generation_report(self, report):
+        messages = []
+        for order_id in sorted(report):
+            messages.extend(report[order_id])
+        return '\n'.join(messages)
+
+    @api.multi
+    def button_check_vouchers_generation(self):
+        voucher_journals = self._get_voucher_journals()
+        report = self.check_vouchers_generation(
+            voucher_journals=voucher_journals)
+        if report:
+            raise Warning(self._format_vouchers_generation_report(report))
+        raise Warning(
+            _("Vouchers can be generated for the selected payment orders"))
 
     def get_lines_by_partner(self, order):
         lines_by_partner = {}
@@ -28,9 +115,59 @@ class PaymentOrder(models.Model):
             lines_by_partner[line.partner_id.id] |= line
         return lines_by_partner
 
+    def get_lines_by_partner_currency(self, order):
+        """Group order lines by (partner, currency): one voucher will be
+        generated for every group"""
+        lines_by_key = {}
+        for line in order.line_ids:
+            key = (line.partner_id.id, line.currency.id)
+            if key not in lines_by_key:
+                lines_by_key[key] = self.env['payment.line']
+            lines_by_key[key] |= line
+        return lines_by_key
+
     def _compute_lines_total(self, payment_lines):
         return sum(payment_lines.mapped('amount_currency'))
 
+    def _get_journal_currency(self, journal):
+        return journal.currency or journal.company_id.currency_id
+
+    @api.multi
+    def _get_voucher_journals(self):
+        """Journals of the vouchers, resolved once for the batch: return
+        {(order id, currency id): journal} for every currency of the order
+        lines. The journal is the one of the payment mode, or else a bank
+        or cash journal of the company in that currency, an empty recordset
+        if there is none"""
+        res = {}
+        groups = self.env['payment.line'].read_group(
+            [('order_id', 'in', self.ids)], ['order_id', 'currency'],
+            ['order_id', 'currency'], lazy=False)
+        journals_by_company = {}
+        for group in groups:
+            if not group['currency']:
+                continue
+            order = self.browse(group['order_id'][0])
+            currency = self.env['res.currency'].browse(group['currency'][0])
+            journal = order.mode.journal
+            if self._get_journal_currency(journal) != currency:
+                company = order.company_id
+                if company.id not in journals_by_company:
+                    journals_by_company[company.id] = self.env[
+                        'account.journal'].search([
+                            ('company_id', '=', company.id),
+                            ('type', 'in', ['bank', 'cash']),
+                            ('default_debit_account_id', '!=', False),
+                        ])
+                journals = journals_by_company[company.id].filtered(
+                    lambda j: self._get_journal_currency(j) == currency)
+                # same kind of journal as the payment mode first
+                journals = journals.sorted(
+                    lambda j: j.type != journal.type)
+                journal = journals and journals[0] or journals
+            res[(order.id, currency.id)] = journal
+        return res
+
     def _get_currency_id(self, payment_lines):
         currency_ids = payment_lines.mapped('currency').ids
         if len(currency_ids) > 1:
@@ -38,22 +175,25 @@ class PaymentOrder(models.Model):
                 _("Every order lines must have the same currency"))
         return currency_ids[0]
 
-    def _build_voucher_header(self, payment_lines):
+    def _build_voucher_header(self, payment_lines, voucher_journals=None):
         total = self._compute_lines_total(payment_lines)
 
-        # every line has the same order and partner
+        # every line has the same order, partner and currency
         order = payment_lines[0].order_id
         partner = payment_lines[0].partner_id
 
         currency_id = self._get_currency_id(payment_lines)
+        # voucher currency is the one of its journal
+        if voucher_journals is None:
+            voucher_journals = order._get_voucher_journals()
+        journal = voucher_journals[(order.id, currency_id)]
         voucher_vals = {
             'type': 'payment',
             'name': order.reference,
             'partner_id': partner.id,
-            'journal_id': order.mode.journal.id,
-            'account_id': order.mode.journal.default_debit_account_id.id,
+            'journal_id': journal.id,
+            'account_id': journal.default_debit_account_id.id,
             'company_id': order.company_id.id,
-            'currency_id': currency_id,
             'date': order.date_done,
             'amount': total,
             }
@@ -72,27 +212,72 @@ class PaymentOrder(models.Model):
             vals_list.append(vals)
         return vals_list
 
+    def _prepare_voucher_run(self, order, vouchers, line_count, timings):
+        vals = {
+            'order_id': order.id,
+            'voucher_count': len(vouchers),
+            'line_count': line_count,
+            'total_time': sum(timings.values()),
+            }
+        for phase in VOUCHER_RUN_PHASES:
+            vals['%s_time' % phase] = timings[phase]
+        return vals
+
+    @api.model
+    def _profile_voucher_generation(self, runs, action_time):
+        """Hook called once per generate_vouchers call, with the runs just
+        logged and the time spent building the returned action. Override it
+        to feed an external profiling or monitoring tool"""
+        total_time = sum(runs.mapped('total_time')) + action_time
+        voucher_count = sum(runs.mapped('voucher_count'))
+        _logger.info(
+            "Generated %d vouchers (%d lines) from %d payment orders "
+            "in %.3fs (%.1f vouchers/s)",
+            voucher_count, sum(runs.mapped('line_count')), len(runs),
+            total_time, total_time and voucher_count / total_time or 0.0)
+
     @api.multi
     def generate_vouchers(self):
         voucher_model = self.env['account.voucher']
         voucher_line_model = self.env['account.voucher.line']
+        run_model = self.env['payment.order.voucher.run']
+        voucher_journals = self._get_voucher_journals()
+        report = self.check_vouchers_generation(
+            voucher_journals=voucher_journals)
+        if report:
+            raise Warning(self._format_vouchers_generation_report(report))
         vouchers = []
+        runs = run_model.browse()
         for order in self:
+            timings = dict.fromkeys(VOUCHER_RUN_PHASES, 0.0)
             order_vouchers = []
-            lines_by_partner = self.get_lines_by_partner(order)
-            for partner_id in lines_by_partner:
-                payment_lines = lines_by_partner[partner_id]
-                voucher_vals = self._build_voucher_header(payment_lines)
-                voucher = voucher_model.create(voucher_vals)
-                line_vals_list = self._build_voucher_lines(
-                    payment_lines, voucher)
-                for line_vals in line_vals_list:
-                    voucher_line_model.create(line_vals)
+            line_count = 0
+            with timed_phase(timings, 'grouping'):
+                lines_by_key = self.get_lines_by_partner_currency(order)
+            for key in sorted(lines_by_key):
+                payment_lines = lines_by_key[key]
+                with timed_phase(timings, 'header'):
+                    voucher_vals = self._build_voucher_header(
+                        payment_lines, voucher_journals=voucher_journals)
+                with timed_phase(timings, 'create'):
+                    voucher = voucher_model.create(voucher_vals)
+                with timed_phase(timings, 'lines'):
+                    line_vals_list = self._build_voucher_lines(
+                        payment_lines, voucher)
+                with timed_phase(timings, 'create'):
+                    for line_vals in line_vals_list:
+                        voucher_line_model.create(line_vals)
+                line_count += len(line_vals_list)
                 order_vouchers.append(voucher)
-            order.voucher_ids = [v.id for v in order_vouchers]
+            with timed_phase(timings, 'link'):
+                order.voucher_ids = [v.id for v in order_vouchers]
+            runs |= run_model.create(self._prepare_voucher_run(
+                order, order_vouchers, line_count, timings))
             vouchers.extend(order_vouchers)
 
+        start = time.time()
         action_res = self.env['ir.actions.act_window'].for_xml_id(
             'account_voucher', 'action_vendor_payment')
         action_res['domain'] = [('id', 'in', [v.id for v in vouchers])]
+        self._profile_voucher_generation(runs, time.time() - start)
         return action_res
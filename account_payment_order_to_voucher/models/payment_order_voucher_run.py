@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from openerp import models, fields
+
+
+class PaymentOrderVoucherRun(models.Model):
+    _name = 'payment.order.voucher.run'
+    _description = 'Payment order voucher generation run'
+    _order = 'date desc, id desc'
+
+    order_id = fields.Many2one(
+        'payment.order', string='Payment order', required=True,
+        ondelete='cascade', index=True)
+    date = fields.Datetime(
+        string='Date', required=True, default=fields.Datetime.now)
+    user_id = fields.Many2one(
+        'res.users', string='User', default=lambda self: self.env.user)
+    voucher_count = fields.Integer(string='Vouchers')
+    line_count = fields.Integer(string='Voucher lines')
+    grouping_time = fields.Float(
+        string='Grouping (s)', digits=(16, 4),
+        help="Time spent grouping payment lines by partner and currency")
+    header_time = fields.Float(
+        string='Header build (s)', digits=(16, 4),
+        help="Time spent preparing voucher values")
+    lines_time = fields.Float(
+        string='Line build (s)', digits=(16, 4),
+        help="Time spent preparing voucher line values")
+    create_time = fields.Float(
+        string='Create (s)', digits=(16, 4),
+        help="Time spent creating vouchers and voucher lines")
+    link_time = fields.Float(
+        string='Link (s)', digits=(16, 4),
+        help="Time spent linking the vouchers to the payment order")
+    total_time = fields.Float(string='Total (s)', digits=(16, 4))
@@ -9,7 +9,7 @@ from openerp import fields
 
 class TestOrder(TransactionCase):
 
-    def test_payment_order(self):
+    def _prepare_payment_order(self):
         payment_wizard = self.env['payment.order.create']
         demo_invoice_0 = self.env.ref('account.demo_invoice_0')
         payment_order_1 = self.env.ref('account_payment.payment_order_1')
@@ -28,8 +28,84 @@ class TestOrder(TransactionCase):
             'active_ids': [payment_order_1.id],
             'active_id': payment_order_1.id,
             }).create_payment()
+        return demo_invoice_0, payment_order_1
+
+    def test_payment_order(self):
+        demo_invoice_0, payment_order_1 = self._prepare_payment_order()
         payment_order_1.set_done()
         payment_order_1.generate_vouchers()
         self.assertEqual(len(payment_order_1.voucher_ids), 1)
         payment_order_1.voucher_ids[0].proforma_voucher()
         self.assertEqual(demo_invoice_0.state, 'paid')
+
+    def test_check_vouchers_generation(self):
+        payment_order_1 = self.env.ref('account_payment.payment_order_1')
+        report = payment_order_1.check_vouchers_generation()
+        self.assertEqual(report, {payment_order_1.id: [
+            "Payment order %s is not in 'done' state"
+            % payment_order_1.reference]})
+        payment_order_1.mode.journal.default_debit_account_id = False
+        report = payment_order_1.check_vouchers_generation()
+        self.assertEqual(report, {payment_order_1.id: [
+            "Payment order %s is not in 'done' state"
+            % payment_order_1.reference,
+            "Journal of payment mode %s does not have a default debit "
+            "account" % payment_order_1.mode.name]})
+
+    def test_check_vouchers_already_generated(self):
+        demo_invoice_0, payment_order_1 = self._prepare_payment_order()
+        payment_order_1.set_done()
+        self.assertEqual(payment_order_1.check_vouchers_generation(), {})
+        payment_order_1.generate_vouchers()
+        report = payment_order_1.check_vouchers_generation()
+        self.assertEqual(report, {payment_order_1.id: [
+            "Payment order %s already has vouchers"
+            % payment_order_1.reference]})
+
+    def test_payment_order_multi_currency(self):
+        demo_invoice_0, payment_order_1 = self._prepare_payment_order()
+        usd = self.env.ref('base.USD')
+        usd_journal = self.env.ref('account.bank_journal_usd')
+        eur_line = payment_order_1.line_ids[0]
+        usd_line = eur_line.copy({'currency': usd.id, 'amount_currency': 20})
+        payment_order_1.set_done()
+        self.assertEqual(payment_order_1._get_voucher_journals(), {
+            (payment_order_1.id, usd.id): usd_journal,
+            (payment_order_1.id, eur_line.currency.id):
+                payment_order_1.mode.journal,
+        })
+        self.assertFalse(payment_order_1.check_vouchers_generation())
+        payment_order_1.generate_vouchers()
+        self.assertEqual(len(payment_order_1.voucher_ids), 2)
+        for voucher in payment_order_1.voucher_ids:
+            if voucher.currency_id == usd:
+                self.assertEqual(voucher.journal_id, usd_journal)
+                self.assertEqual(voucher.amount, usd_line.amount_currency)
+                self.assertEqual(
+                    voucher.line_dr_ids.mapped('amount'), [20.0])
+            else:
+                self.assertEqual(
+                    voucher.journal_id, payment_order_1.mode.journal)
+                self.assertEqual(voucher.amount, eur_line.amount_currency)
+                self.assertEqual(
+                    voucher.line_dr_ids.mapped('amount'),
+                    [eur_line.amount_currency])
+
+    def test_payment_order_currency_without_journal(self):
+        demo_invoice_0, payment_order_1 = self._prepare_payment_order()
+        chf = self.env.ref('base.CHF')
+        payment_order_1.line_ids[0].copy({'currency': chf.id})
+        payment_order_1.set_done()
+        report = payment_order_1.check_vouchers_generation()
+        self.assertTrue(
+            [problem for problem in report.get(payment_order_1.id, [])
+             if chf.name in problem])
+
+    def test_voucher_generation_log(self):
+        demo_invoice_0, payment_order_1 = self._prepare_payment_order()
+        payment_order_1.set_done()
+        payment_order_1.generate_vouchers()
+        self.assertEqual(len(payment_order_1.voucher_run_ids), 1)
+        run = payment_order_1.voucher_run_ids
+        self.assertEqual(run.voucher_count, 1)
+        self.assertEqual(run.line_count, 1)
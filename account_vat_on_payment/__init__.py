@@ -22,9 +22,13 @@
 from . import account_voucher
 from . import company
 from . import account_invoice
+from . import account_move
 from . import account_move_line
 from . import account_account
 from . import account_tax_code
 from . import account_journal
 from . import account_config_settings
 from . import account_fiscal_position
+from . import ir_property
+from . import vat_on_payment_snapshot
+from . import wizard
@@ -51,14 +51,19 @@ http://planet.agilebg.com/en/2012/10/vat-on-payment-treatment-with-openerp/
 Also, see demo and test data
 """,
     'data': [
+        'security/ir.model.access.csv',
         'account_account_view.xml',
         'account_tax_code_view.xml',
         'account_journal_view.xml',
         'account_invoice_view.xml',
+        'account_move_view.xml',
         'account_move_line_view.xml',
         'account_voucher_view.xml',
         'account_config_settings_view.xml',
         'account_fiscal_position_view.xml',
+        'vat_on_payment_snapshot_view.xml',
+        'vat_on_payment_snapshot_data.xml',
+        'wizard/vat_on_payment_repair_view.xml',
     ],
     'demo': [
         'account_demo.xml',
@@ -31,3 +31,23 @@ class AccountAccount(orm.Model):
             help="Related account used for real registrations on a "
                  "VAT on payment basis. Set the shadow account here"),
     }
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(AccountAccount, self).create(
+            cr, uid, vals, context=context)
+        self.pool.get('res.company').clear_caches()
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if (
+            'type' in vals or 'company_id' in vals
+            or 'vat_on_payment_related_account_id' in vals
+        ):
+            self.pool.get('res.company').clear_caches()
+        return super(AccountAccount, self).write(
+            cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.pool.get('res.company').clear_caches()
+        return super(AccountAccount, self).unlink(
+            cr, uid, ids, context=context)
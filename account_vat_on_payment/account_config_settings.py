@@ -19,6 +19,7 @@
 ##############################################################################
 
 from openerp.osv import orm, fields
+from openerp.tools.translate import _
 
 
 class AccountConfigSettings(orm.TransientModel):
@@ -44,3 +45,24 @@ class AccountConfigSettings(orm.TransientModel):
                 'vat_on_payment': False,
             })
         return res
+
+    def button_check_vat_on_payment_mappings(
+        self, cr, uid, ids, context=None
+    ):
+        settings = self.browse(cr, uid, ids[0], context=context)
+        report = self.pool.get('res.company').check_vat_on_payment_mappings(
+            cr, uid, [settings.company_id.id], context=context)
+        problems = report.get(settings.company_id.id)
+        if problems:
+            raise orm.except_orm(
+                _('VAT on payment mappings'), '\n'.join(problems))
+        raise orm.except_orm(
+            _('VAT on payment mappings'),
+            _('Every VAT on payment mapping is correct'))
+
+    def button_rebuild_vat_on_payment_snapshots(
+        self, cr, uid, ids, context=None
+    ):
+        self.pool.get('account.vat.on.payment.snapshot').rebuild_snapshots(
+            cr, uid, context=context)
+        return True
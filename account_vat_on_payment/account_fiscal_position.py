@@ -32,3 +32,14 @@ class AccountFiscalPosition(orm.Model):
         'default_has_vat_on_payment': fields.boolean(
             'VAT on Payment Default Flag'),
     }
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if 'default_has_vat_on_payment' in vals:
+            self.pool.get('account.invoice').clear_caches()
+        return super(AccountFiscalPosition, self).write(
+            cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.pool.get('account.invoice').clear_caches()
+        return super(AccountFiscalPosition, self).unlink(
+            cr, uid, ids, context=context)
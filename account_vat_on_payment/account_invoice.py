@@ -22,48 +22,129 @@
 
 from openerp.osv import orm, fields
 from openerp.tools.translate import _
-from openerp import api
+from openerp import api, tools, SUPERUSER_ID
 
 
 class AccountInvoice(orm.Model):
 
+    def get_company_vat_on_payment(self, cr, uid, company_id):
+        """'VAT on payment' flag of the company, from its cached
+        configuration"""
+        return self.pool.get('res.company').get_vat_on_payment_config(
+            cr, company_id)['vat_on_payment']
+
+    @tools.ormcache(skiparg=3)
+    def get_partner_vat_on_payment(self, cr, uid, partner_id, company_id):
+        """
+        'VAT on payment' default of the fiscal position of the partner in
+        the company, None if the partner has no fiscal position. Cleared
+        when fiscal positions or properties change
+        """
+        return self._get_partners_vat_on_payment(
+            cr, [partner_id], company_id)[partner_id]
+
+    def _get_partners_vat_on_payment(self, cr, partner_ids, company_id):
+        partners = self.pool.get('res.partner').read(
+            cr, SUPERUSER_ID, partner_ids, ['property_account_position'],
+            context={'force_company': company_id})
+        position_ids = set(
+            partner['property_account_position'][0] for partner in partners
+            if partner['property_account_position'])
+        defaults = dict(
+            (position['id'], position['default_has_vat_on_payment'])
+            for position in self.pool.get('account.fiscal.position').read(
+                cr, SUPERUSER_ID, list(position_ids),
+                ['default_has_vat_on_payment']))
+        return dict(
+            (partner['id'],
+             partner['property_account_position']
+             and defaults[partner['property_account_position'][0]]
+             or None)
+            for partner in partners)
+
+    def get_vat_on_payment_defaults(
+        self, cr, uid, partner_ids, company_id=None, context=None
+    ):
+        """
+        Return {partner_id: 'VAT on payment' default of a new invoice}, as
+        given by the fiscal position of the partner or else by the company.
+        Meant for imports: partners and fiscal positions are read at once
+        """
+        if company_id is None:
+            company_id = self.pool.get('res.users')._get_company(
+                cr, uid, context=context)
+        company_default = self.get_company_vat_on_payment(
+            cr, uid, company_id)
+        res = {}
+        for partner_id, default in self._get_partners_vat_on_payment(
+            cr, list(set(partner_ids)), company_id
+        ).iteritems():
+            res[partner_id] = (
+                company_default if default is None else default)
+        return res
+
     def _get_vat_on_payment(self, cr, uid, context=None):
-        return self.pool.get('res.users').browse(
-            cr, uid, uid, context).company_id.vat_on_payment
+        context = context or {}
+        company_id = (
+            context.get('force_company') or context.get('company_id')
+            or self.pool.get('res.company')._company_default_get(
+                cr, uid, 'account.invoice', context=context))
+        return self.get_company_vat_on_payment(cr, uid, company_id)
 
-    def _set_vat_on_payment_account(self, cr, uid, line_tuple, context=None):
+    def _set_vat_on_payment_account(
+        self, cr, uid, line_tuple, company_id=None, context=None
+    ):
         acc_pool = self.pool.get('account.account')
-        account = acc_pool.browse(
-            cr, uid, line_tuple[2]['account_id'], context=context)
-        if account.type not in ['receivable', 'payable']:
-            if not account.vat_on_payment_related_account_id:
+        account_id = line_tuple[2]['account_id']
+        if not company_id:
+            company_id = acc_pool.browse(
+                cr, uid, account_id, context=context).company_id.id
+        account_map = self.pool.get(
+            'res.company').get_vat_on_payment_config(
+                cr, company_id)['accounts']
+        if account_id in account_map:
+            account_type, shadow_account_id = account_map[account_id]
+        else:
+            # created by another process since the map was loaded
+            account = acc_pool.browse(cr, uid, account_id, context=context)
+            account_type = account.type
+            shadow_account_id = account.vat_on_payment_related_account_id.id
+        if account_type not in ['receivable', 'payable']:
+            if not shadow_account_id:
+                account = acc_pool.browse(
+                    cr, uid, account_id, context=context)
                 raise orm.except_orm(
                     _('Error'),
                     _("The invoice is 'VAT on payment' but "
                       "account %s does not have a related shadow "
                       "account")
                     % account.name)
-            line_tuple[2]['real_account_id'] = line_tuple[
-                2]['account_id']
-            line_tuple[2]['account_id'] = (
-                account.vat_on_payment_related_account_id.id)
+            line_tuple[2]['real_account_id'] = account_id
+            line_tuple[2]['account_id'] = shadow_account_id
         return line_tuple
 
-    def _set_vat_on_payment_tax_code(self, cr, uid, line_tuple, context=None):
+    def _set_vat_on_payment_tax_code(
+        self, cr, uid, line_tuple, company_id=None, context=None
+    ):
         tax_code_pool = self.pool.get('account.tax.code')
-        tax_code = tax_code_pool.browse(
-            cr, uid, line_tuple[2]['tax_code_id'], context=context)
-        if not tax_code.vat_on_payment_related_tax_code_id:
+        tax_code_id = line_tuple[2]['tax_code_id']
+        if not company_id:
+            company_id = tax_code_pool.browse(
+                cr, uid, tax_code_id, context=context).company_id.id
+        shadow_tax_code_id = self.pool.get(
+            'res.company').get_vat_on_payment_config(
+                cr, company_id)['tax_codes'].get(tax_code_id)
+        if not shadow_tax_code_id:
+            tax_code = tax_code_pool.browse(
+                cr, uid, tax_code_id, context=context)
             raise orm.except_orm(
                 _('Error'),
                 _("The invoice is 'VAT on payment' but "
                   "tax code %s does not have a related shadow "
                   "tax code")
                 % tax_code.name)
-        line_tuple[2]['real_tax_code_id'] = line_tuple[
-            2]['tax_code_id']
-        line_tuple[2]['tax_code_id'] = (
-            tax_code.vat_on_payment_related_tax_code_id.id)
+        line_tuple[2]['real_tax_code_id'] = tax_code_id
+        line_tuple[2]['tax_code_id'] = shadow_tax_code_id
         return line_tuple
 
     def finalize_invoice_move_lines(self, cr, uid, ids, move_lines, context):
@@ -74,20 +155,91 @@ class AccountInvoice(orm.Model):
         move_lines = super(AccountInvoice, self).finalize_invoice_move_lines(
             cr, uid, ids, move_lines, context)
         assert len(ids) == 1
-        invoice_browse = self.browse(cr, uid, ids, context=context)
+        invoice = self.read(
+            cr, uid, ids[0], ['vat_on_payment', 'company_id'],
+            context=context)
+        if not invoice['vat_on_payment']:
+            return move_lines
+        company_id = invoice['company_id'][0]
         context = self.pool['res.users'].context_get(cr, uid)
         new_move_lines = []
         for line_tuple in move_lines:
-            if invoice_browse.vat_on_payment:
-                if line_tuple[2].get('account_id', False):
-                    line_tuple = self._set_vat_on_payment_account(
-                        cr, uid, line_tuple, context=context)
-                if line_tuple[2].get('tax_code_id', False):
-                    line_tuple = self._set_vat_on_payment_tax_code(
-                        cr, uid, line_tuple, context=context)
+            if line_tuple[2].get('account_id', False):
+                line_tuple = self._set_vat_on_payment_account(
+                    cr, uid, line_tuple, company_id=company_id,
+                    context=context)
+            if line_tuple[2].get('tax_code_id', False):
+                line_tuple = self._set_vat_on_payment_tax_code(
+                    cr, uid, line_tuple, company_id=company_id,
+                    context=context)
             new_move_lines.append(line_tuple)
         return new_move_lines
 
+    def _get_vat_on_payment_move_ids(self, cr, uid, ids, context=None):
+        cr.execute("""
+            SELECT move_id FROM account_invoice
+            WHERE id IN %s AND vat_on_payment AND move_id IS NOT NULL
+            """, (tuple(ids), ))
+        return [row[0] for row in cr.fetchall()]
+
+    def action_move_create(self, cr, uid, ids, context=None):
+        res = super(AccountInvoice, self).action_move_create(
+            cr, uid, ids, context=context)
+        self.pool.get('account.vat.on.payment.snapshot').update_snapshots(
+            cr, uid, self._get_vat_on_payment_move_ids(
+                cr, uid, ids, context=context),
+            context=context)
+        return res
+
+    def action_cancel(self, cr, uid, ids, context=None):
+        # entries are deleted by the cancellation
+        self.pool.get('account.vat.on.payment.snapshot').update_snapshots(
+            cr, uid, self._get_vat_on_payment_move_ids(
+                cr, uid, ids, context=context),
+            sign=-1, context=context)
+        return super(AccountInvoice, self).action_cancel(
+            cr, uid, ids, context=context)
+
+    def _get_payment_moves(self, cr, uid, ids, field_names, arg, context=None):
+        """
+        Real and shadow entries of the 'VAT on payment' payments, from the
+        lines reconciled with the invoice receivable/payable line. Computed
+        for every invoice with one query
+        """
+        res = dict(
+            (invoice_id, {
+                'real_payment_move_ids': [],
+                'shadow_payment_move_ids': [],
+            }) for invoice_id in ids)
+        if not ids:
+            return res
+        cr.execute("""
+            SELECT inv.id, pl.real_payment_move_id, pl.move_id
+            FROM account_invoice inv
+            JOIN account_move_line il
+                ON il.move_id = inv.move_id AND il.account_id = inv.account_id
+            JOIN account_move_line pl
+                ON pl.reconcile_id = il.reconcile_id AND pl.id != il.id
+            WHERE inv.id IN %s AND pl.real_payment_move_id IS NOT NULL
+            UNION
+            SELECT inv.id, pl.real_payment_move_id, pl.move_id
+            FROM account_invoice inv
+            JOIN account_move_line il
+                ON il.move_id = inv.move_id AND il.account_id = inv.account_id
+            JOIN account_move_line pl
+                ON pl.reconcile_partial_id = il.reconcile_partial_id
+                AND pl.id != il.id
+            WHERE inv.id IN %s AND pl.real_payment_move_id IS NOT NULL
+            ORDER BY 1, 2
+            """, (tuple(ids), tuple(ids)))
+        for invoice_id, real_move_id, shadow_move_id in cr.fetchall():
+            moves = res[invoice_id]
+            if real_move_id not in moves['real_payment_move_ids']:
+                moves['real_payment_move_ids'].append(real_move_id)
+            if shadow_move_id not in moves['shadow_payment_move_ids']:
+                moves['shadow_payment_move_ids'].append(shadow_move_id)
+        return res
+
     @api.cr_uid_ids
     def onchange_partner_id(
             self, cr, uid, ids, inv_type, partner_id, date_invoice=False,
@@ -98,19 +250,24 @@ class AccountInvoice(orm.Model):
             partner_bank_id, company_id, context)
         # default value for VAT on Payment is changed every time the
         # customer/supplier is changed
-        partner_obj = self.pool.get("res.partner")
-        context = self.pool['res.users'].context_get(cr, uid)
         if partner_id:
-            p = partner_obj.browse(cr, uid, partner_id, context=context)
-            if p.property_account_position:
-                res['value'][
-                    'vat_on_payment'
-                ] = p.property_account_position.default_has_vat_on_payment
+            default = self.get_partner_vat_on_payment(
+                cr, uid, partner_id,
+                company_id or self.pool.get('res.users')._get_company(
+                    cr, uid, context=context))
+            if default is not None:
+                res['value']['vat_on_payment'] = default
         return res
 
     _inherit = "account.invoice"
     _columns = {
         'vat_on_payment': fields.boolean('Vat on payment'),
+        'real_payment_move_ids': fields.function(
+            _get_payment_moves, type='many2many', relation='account.move',
+            string='Real payment entries', multi='vat_on_payment_moves'),
+        'shadow_payment_move_ids': fields.function(
+            _get_payment_moves, type='many2many', relation='account.move',
+            string='Shadow payment entries', multi='vat_on_payment_moves'),
     }
     _defaults = {
         'vat_on_payment': _get_vat_on_payment,
@@ -31,3 +31,20 @@ class AccountJournal(orm.Model):
             help="Related journal used for shadow registrations on a "
                  "VAT on payment basis. Set the shadow journal here"),
     }
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(AccountJournal, self).create(
+            cr, uid, vals, context=context)
+        self.pool.get('res.company').clear_caches()
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if 'vat_on_payment_related_journal_id' in vals or 'company_id' in vals:
+            self.pool.get('res.company').clear_caches()
+        return super(AccountJournal, self).write(
+            cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.pool.get('res.company').clear_caches()
+        return super(AccountJournal, self).unlink(
+            cr, uid, ids, context=context)
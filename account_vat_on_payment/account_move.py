@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2011-2012 Domsense s.r.l. (<http://www.domsense.com>).
+#    Copyright (C) 2014 Agile Business Group sagl (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import orm, fields
+from openerp.tools.translate import _
+
+
+class AccountMove(orm.Model):
+    _inherit = "account.move"
+
+    _columns = {
+        'vat_on_payment_pending': fields.boolean(
+            'Waiting for VAT on payment entry', readonly=True, copy=False,
+            help="Payment entry of a 'VAT on payment' voucher whose shadow "
+                 "entry is not generated yet. It can't be posted until "
+                 "then"),
+    }
+
+    def post(self, cr, uid, ids, context=None):
+        # account_voucher posts the payment entry as soon as it balances
+        # when journal has 'skip draft state', but "mixed" entry (shadow +
+        # real) won't pass validation. Pending entries are left draft, and
+        # posted by account.voucher once the shadow entry is generated
+        if ids and not (context or {}).get('vat_on_payment_post'):
+            ids = [
+                move.id for move in self.browse(cr, uid, ids, context=context)
+                if not move.vat_on_payment_pending
+            ]
+            if not ids:
+                return True
+        return super(AccountMove, self).post(cr, uid, ids, context=context)
+
+    def button_validate(self, cr, uid, ids, context=None):
+        # entries validated by hand: a pending entry whose shadow entry is
+        # missing must be repaired, not posted as is. While the voucher is
+        # posted, pending entries are left draft, see post
+        if not (context or {}).get('vat_on_payment_pending'):
+            for move in self.browse(cr, uid, ids, context=context):
+                if move.vat_on_payment_pending:
+                    raise orm.except_orm(
+                        _('Error'),
+                        _("Entry %s is waiting for its VAT on payment shadow "
+                          "entry: repair the voucher entries instead")
+                        % move.name)
+        return super(AccountMove, self).button_validate(
+            cr, uid, ids, context=context)
@@ -27,8 +27,9 @@ class AccountMoveLine(orm.Model):
     _inherit = "account.move.line"
     _columns = {
         'real_payment_move_id': fields.many2one(
-            'account.move', 'Real payment entry'),
-        'real_account_id': fields.many2one('account.account', 'Real account'),
+            'account.move', 'Real payment entry', select=True),
+        'real_account_id': fields.many2one(
+            'account.account', 'Real account', select=True),
         'real_tax_code_id': fields.many2one(
-            'account.tax.code', 'Real tax code'),
+            'account.tax.code', 'Real tax code', select=True),
     }
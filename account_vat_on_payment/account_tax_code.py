@@ -31,3 +31,23 @@ class AccountTaxCode(orm.Model):
             help="Related tax code used for real registrations on a "
                  "VAT on payment basis. Set the shadow tax code here"),
     }
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(AccountTaxCode, self).create(
+            cr, uid, vals, context=context)
+        self.pool.get('res.company').clear_caches()
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if (
+            'vat_on_payment_related_tax_code_id' in vals or
+            'company_id' in vals
+        ):
+            self.pool.get('res.company').clear_caches()
+        return super(AccountTaxCode, self).write(
+            cr, uid, ids, vals, context=context)
+
+    def unlink(self, cr, uid, ids, context=None):
+        self.pool.get('res.company').clear_caches()
+        return super(AccountTaxCode, self).unlink(
+            cr, uid, ids, context=context)
@@ -20,9 +20,17 @@
 #
 ##############################################################################
 
+import logging
+import Queue
+import threading
+import time
+
+from openerp import api, tools
 from openerp.osv import orm, fields
 from openerp.tools.translate import _
 
+_logger = logging.getLogger(__name__)
+
 
 class AccountVoucher(orm.Model):
     _inherit = "account.voucher"
@@ -33,23 +41,40 @@ class AccountVoucher(orm.Model):
     }
 
     def is_vat_on_payment(self, voucher):
-        vat_on_p = 0
-        valid_lines = 0
-        if voucher.type in ('payment', 'receipt'):
-            for line in voucher.line_ids:
-                if line.amount:
-                    valid_lines += 1
-                    if (
-                        line.move_line_id and line.move_line_id.invoice
-                        and line.move_line_id.invoice.vat_on_payment
-                    ):
-                        vat_on_p += 1
+        return self.classify_vat_on_payment(
+            voucher._cr, voucher._uid, [voucher.id],
+            context=voucher._context)[voucher.id]
+
+    def classify_vat_on_payment(self, cr, uid, ids, context=None):
+        """
+        Return a dictionary {voucher_id: number of lines paying a 'VAT on
+        payment' invoice}, computed for every voucher with one query.
+        Only lines with an amount of payments and receipts are considered,
+        and they must all pay 'VAT on payment' invoices or none of them
+        """
+        res = dict.fromkeys(ids, 0)
+        if not ids:
+            return res
+        cr.execute("""
+            SELECT v.id, COUNT(vl.id),
+                SUM(CASE WHEN inv.vat_on_payment THEN 1 ELSE 0 END)
+            FROM account_voucher v
+            JOIN account_voucher_line vl ON vl.voucher_id = v.id
+            LEFT JOIN account_move_line aml ON aml.id = vl.move_line_id
+            LEFT JOIN account_invoice inv ON inv.move_id = aml.move_id
+            WHERE v.id IN %s
+            AND v.type IN ('payment', 'receipt')
+            AND vl.amount <> 0
+            GROUP BY v.id
+            """, (tuple(ids), ))
+        for voucher_id, valid_lines, vat_on_p in cr.fetchall():
             if vat_on_p and vat_on_p != valid_lines:
                 raise orm.except_orm(
                     _('Error'),
                     _("Can't handle VAT on payment if not every invoice "
                       "is on a VAT on payment treatment"))
-        return vat_on_p
+            res[voucher_id] = vat_on_p
+        return res
 
     def _compute_allocated_amount(
         self, cr, uid, voucher, allocated=0, write_off=0, context=None
@@ -67,10 +92,99 @@ class AccountVoucher(orm.Model):
             allocated_amount = allocated
         return allocated_amount
 
+    def _split_line_amounts(
+        self, cr, uid, ratio, amounts, currency, context=None
+    ):
+        """
+        Return ratio * amount for each of the signed amounts, rounded
+        according to currency. Lines on the same side (debit or credit)
+        share the rounded total of their side, split by largest remainder,
+        so that the parts add up exactly and the entries are balanced by
+        construction
+        """
+        res = [0.0] * len(amounts)
+        for side in (1, -1):
+            indexes = [
+                index for index, amount in enumerate(amounts)
+                if amount * side > 0]
+            if not indexes:
+                continue
+            side_amounts = [amounts[index] for index in indexes]
+            parts = super(AccountVoucher, self)._split_amount(
+                cr, uid, ratio * sum(side_amounts), side_amounts, currency,
+                context=context)
+            for index, part in zip(indexes, parts):
+                res[index] = part
+        return res
+
+    def _compute_new_lines_amounts(
+        self, cr, uid, voucher, inv_move_lines, amounts_by_invoice, invoice,
+        context=None
+    ):
+        """
+        Split the amount allocated to the invoice over its move lines, in
+        proportion to them. Return a list of (amount, amount in currency)
+        of the lines, amount in currency being False for invoices in
+        company currency. Each line amount is returned by
+        _compute_new_line_amount and _compute_new_line_currency_amount,
+        given the exact split in context
+        """
+        currency_obj = self.pool.get('res.currency')
+        amounts = amounts_by_invoice[invoice.id]
+        allocated_amount = self._compute_allocated_amount(
+            cr, uid, voucher,
+            allocated=amounts['allocated'],
+            write_off=amounts['write-off'],
+            context=context)
+        ratio = amounts['total'] and allocated_amount / amounts['total']
+        new_amounts = [
+            abs(amount) for amount in self._split_line_amounts(
+                cr, uid, ratio, [
+                    line.credit - line.debit for line in inv_move_lines],
+                voucher.company_id.currency_id, context=context)
+        ]
+        new_amounts_curr = [False] * len(inv_move_lines)
+        if (
+            amounts.get('allocated_currency')
+            and amounts.get('foreign_currency_id')
+        ):
+            for_curr = currency_obj.browse(
+                cr, uid, amounts['foreign_currency_id'], context=context)
+            allocated_amount = self._compute_allocated_amount(
+                cr, uid, voucher,
+                allocated=amounts['allocated_currency'],
+                write_off=amounts['currency-write-off'],
+                context=context)
+            ratio = (
+                amounts['total_currency']
+                and allocated_amount / amounts['total_currency'])
+            new_amounts_curr = self._split_line_amounts(
+                cr, uid, ratio,
+                [line.amount_currency for line in inv_move_lines],
+                for_curr, context=context)
+        # amounts of every line go through the per line hooks, which
+        # return the exact split unless overridden
+        ctx = dict(context or {}, vat_on_payment_split=dict(
+            (line.id, (amount, amount_curr))
+            for line, amount, amount_curr in zip(
+                inv_move_lines, new_amounts, new_amounts_curr)))
+        return [
+            (self._compute_new_line_amount(
+                cr, uid, voucher, line, amounts_by_invoice, invoice,
+                context=ctx),
+             self._compute_new_line_currency_amount(
+                cr, uid, voucher, line, amounts_by_invoice, invoice,
+                context=ctx))
+            for line in inv_move_lines
+        ]
+
     def _compute_new_line_amount(
         self, cr, uid, voucher, inv_move_line, amounts_by_invoice, invoice,
         context=None
     ):
+        split = (context or {}).get('vat_on_payment_split') or {}
+        if inv_move_line.id in split:
+            return split[inv_move_line.id][0]
         currency_obj = self.pool.get('res.currency')
         allocated_amount = self._compute_allocated_amount(
             cr, uid, voucher,
@@ -89,6 +203,9 @@ class AccountVoucher(orm.Model):
         self, cr, uid, voucher, inv_move_line, amounts_by_invoice, invoice,
         context=None
     ):
+        split = (context or {}).get('vat_on_payment_split') or {}
+        if inv_move_line.id in split:
+            return split[inv_move_line.id][1]
         currency_obj = self.pool.get('res.currency')
         new_line_amount_curr = False
         if (
@@ -182,11 +299,15 @@ class AccountVoucher(orm.Model):
                 vals['tax_amount'] = -new_line_amount
         return vals
 
+    def _get_shadow_journal_id(self, cr, uid, voucher, context=None):
+        return self.pool.get('res.company').get_vat_on_payment_config(
+            cr, voucher.company_id.id)['journals'].get(
+                voucher.journal_id.id, False)
+
     def _prepare_shadow_move(self, cr, uid, voucher, context=None):
         return {
-            'journal_id': (
-                voucher.journal_id.vat_on_payment_related_journal_id.id
-            ),
+            'journal_id': self._get_shadow_journal_id(
+                cr, uid, voucher, context=context),
             'period_id': voucher.move_id.period_id.id,
             'date': voucher.move_id.date,
         }
@@ -194,151 +315,535 @@ class AccountVoucher(orm.Model):
     def _move_payment_lines_to_shadow_entry(
         self, cr, uid, voucher, shadow_move_id, context=None
     ):
+        move_line_pool = self.pool.get('account.move.line')
+        keep_write_off = (
+            voucher.exclude_write_off
+            and voucher.payment_option == 'with_writeoff'
+        )
+        to_shadow_ids = []
+        payment_line_ids = []
         for line in voucher.move_ids:
-            if line.account_id.type != 'liquidity':
-                # If the line is related to write-off and user doesn't
-                # want to compute the tax including write-off,
-                # write-off move line must stay on the real move
-                if not (
-                    voucher.exclude_write_off
-                    and voucher.payment_option == 'with_writeoff'
-                    and line.account_id.id
-                        == voucher.writeoff_acc_id.id
-                ):
-                    line.write({
-                        'move_id': shadow_move_id,
-                    }, update_check=False)
-                # this will allow user to see the real entry from
-                # invoice payment tab
-                if (
-                    line.account_id.type == 'receivable'
-                    or line.account_id.type == 'payable'
-                ):
-                    line.write({
-                        'real_payment_move_id': voucher.move_id.id,
-                    })
+            if line.account_id.type == 'liquidity':
+                continue
+            # If the line is related to write-off and user doesn't
+            # want to compute the tax including write-off,
+            # write-off move line must stay on the real move
+            if not (
+                keep_write_off
+                and line.account_id.id == voucher.writeoff_acc_id.id
+            ):
+                to_shadow_ids.append(line.id)
+            # this will allow user to see the real entry from
+            # invoice payment tab
+            if (
+                line.account_id.type == 'receivable'
+                or line.account_id.type == 'payable'
+            ):
+                payment_line_ids.append(line.id)
+        if to_shadow_ids:
+            move_line_pool.write(
+                cr, uid, to_shadow_ids, {'move_id': shadow_move_id},
+                context=context, update_check=False)
+        if payment_line_ids:
+            # amounts don't change: no need to validate the move again
+            move_line_pool.write(
+                cr, uid, payment_line_ids,
+                {'real_payment_move_id': voucher.move_id.id},
+                context=context, check=False)
+        # lines of both entries changed
+        self.pool.get('account.move').invalidate_cache(
+            cr, uid, ['line_id'], [voucher.move_id.id, shadow_move_id],
+            context=context)
+        self.invalidate_cache(
+            cr, uid, ['move_ids'], [voucher.id], context=context)
         return True
 
-    def _create_vat_on_payment_move(self, cr, uid, voucher, context=None):
+    def _prepare_vat_on_payment_lines(
+        self, cr, uid, voucher, amounts_by_invoice, context=None
+    ):
+        """
+        Compute the real and shadow lines of every invoice paid by the
+        voucher. Move lines of every invoice are loaded by one query.
+        Return a tuple (real lines values, shadow lines values)
+        """
         move_line_pool = self.pool.get('account.move.line')
-        move_pool = self.pool.get('account.move')
         inv_pool = self.pool.get('account.invoice')
-        if not voucher.journal_id.vat_on_payment_related_journal_id:
+        real_lines = []
+        shadow_lines = []
+        if not amounts_by_invoice:
+            return real_lines, shadow_lines
+        invoices = inv_pool.browse(
+            cr, uid, sorted(amounts_by_invoice), context=context)
+        move_ids = [invoice.move_id.id for invoice in invoices]
+        # same order as invoice.move_id.line_id
+        cr.execute("""
+            SELECT id FROM account_move_line
+            WHERE move_id IN %s
+            ORDER BY date DESC, id DESC
+            """, (tuple(move_ids), ))
+        lines_by_move = {}
+        for inv_move_line in move_line_pool.browse(
+            cr, uid, [row[0] for row in cr.fetchall()], context=context
+        ):
+            lines_by_move.setdefault(
+                inv_move_line.move_id.id, []).append(inv_move_line)
+        for invoice in invoices:
+            foreign_currency_id = amounts_by_invoice[
+                invoice.id]['foreign_currency_id']
+            inv_move_lines = [
+                inv_move_line
+                for inv_move_line in lines_by_move.get(invoice.move_id.id, [])
+                if inv_move_line.account_id.type not in (
+                    'receivable', 'payable')
+            ]
+            new_lines_amounts = self._compute_new_lines_amounts(
+                cr, uid, voucher, inv_move_lines, amounts_by_invoice,
+                invoice, context=context)
+            for inv_move_line, (new_line_amount, new_line_amount_curr) in zip(
+                inv_move_lines, new_lines_amounts
+            ):
+                real_vals = self._prepare_real_move_line(
+                    cr, uid, inv_move_line, new_line_amount,
+                    new_line_amount_curr, foreign_currency_id,
+                    context=context)
+                del real_vals['type']
+                real_lines.append(real_vals)
+                shadow_vals = self._prepare_shadow_move_line(
+                    cr, uid, inv_move_line, new_line_amount,
+                    context=context)
+                del shadow_vals['type']
+                shadow_lines.append(shadow_vals)
+        return real_lines, shadow_lines
+
+    def _get_vat_on_payment_lines(self, cr, uid, voucher, context=None):
+        """Real and shadow lines values the voucher generates"""
+        amounts_by_invoice = super(
+            AccountVoucher, self
+        ).allocated_amounts_grouped_by_invoice(
+            cr, uid, voucher, context)
+        return self._prepare_vat_on_payment_lines(
+            cr, uid, voucher, amounts_by_invoice, context=context)
+
+    def _create_vat_on_payment_move(self, cr, uid, voucher, context=None):
+        move_pool = self.pool.get('account.move')
+        shadow_journal_id = self._get_shadow_journal_id(
+            cr, uid, voucher, context=context)
+        if not shadow_journal_id:
             raise orm.except_orm(
                 _('Error'),
                 _("We are on a VAT on payment treatment "
                   "but journal %s does not have a related shadow "
                   "journal")
                 % voucher.journal_id.name)
-        lines_to_create = []
-        amounts_by_invoice = super(
-            AccountVoucher, self
-        ).allocated_amounts_grouped_by_invoice(
-            cr, uid, voucher, context)
-        for inv_id in amounts_by_invoice:
-            invoice = inv_pool.browse(cr, uid, inv_id, context)
-            for inv_move_line in invoice.move_id.line_id:
-                if (
-                    inv_move_line.account_id.type != 'receivable'
-                    and inv_move_line.account_id.type != 'payable'
-                ):
-                    new_line_amount = self._compute_new_line_amount(
-                        cr, uid, voucher, inv_move_line,
-                        amounts_by_invoice, invoice, context=context)
-                    new_line_amount_curr = (
-                        self._compute_new_line_currency_amount(
-                            cr, uid, voucher, inv_move_line,
-                            amounts_by_invoice, invoice,
-                            context=context)
-                    )
-                    foreign_currency_id = amounts_by_invoice[
-                        invoice.id]['foreign_currency_id']
-                    real_vals = self._prepare_real_move_line(
-                        cr, uid, inv_move_line, new_line_amount,
-                        new_line_amount_curr, foreign_currency_id,
-                        context=context)
-                    lines_to_create.append(real_vals)
-
-                    shadow_vals = self._prepare_shadow_move_line(
-                        cr, uid, inv_move_line, new_line_amount,
-                        context=context)
-                    lines_to_create.append(shadow_vals)
+        real_lines, shadow_lines = self._get_vat_on_payment_lines(
+            cr, uid, voucher, context=context)
 
+        # shadow entry is created together with its lines, so that it is
+        # validated once
         ctx = dict(context) or {}
-        ctx['journal_id'] = (
-            voucher.journal_id.vat_on_payment_related_journal_id.id)
+        ctx['journal_id'] = shadow_journal_id
         ctx['period_id'] = voucher.move_id.period_id.id
-        shadow_move_id = move_pool.create(
-            cr, uid, self._prepare_shadow_move(
-                cr, uid, voucher, context=ctx), ctx)
+        shadow_move_vals = self._prepare_shadow_move(
+            cr, uid, voucher, context=ctx)
+        shadow_move_vals['line_id'] = [
+            (0, 0, vals) for vals in shadow_lines]
+        shadow_move_id = move_pool.create(cr, uid, shadow_move_vals, ctx)
 
         self._move_payment_lines_to_shadow_entry(
             cr, uid, voucher, shadow_move_id, context=ctx)
 
-        for line_to_create in lines_to_create:
-            if line_to_create['type'] == 'real':
-                line_to_create['move_id'] = voucher.move_id.id
-            elif line_to_create['type'] == 'shadow':
-                line_to_create['move_id'] = shadow_move_id
-            del line_to_create['type']
-
-            move_line_pool.create(cr, uid, line_to_create, ctx)
+        # the real entry is complete: it can be posted
+        real_vals = {'vat_on_payment_pending': False}
+        if real_lines:
+            real_vals['line_id'] = [(0, 0, vals) for vals in real_lines]
+        real_ctx = dict(context) or {}
+        real_ctx['journal_id'] = voucher.move_id.journal_id.id
+        real_ctx['period_id'] = voucher.move_id.period_id.id
+        move_pool.write(
+            cr, uid, [voucher.move_id.id], real_vals, context=real_ctx)
 
         voucher.write({'shadow_move_id': shadow_move_id})
 
-        super(AccountVoucher, self).balance_move(
-            cr, uid, shadow_move_id, ctx)
-        super(AccountVoucher, self).balance_move(
-            cr, uid, voucher.move_id.id, ctx)
+        # lines are split exactly: entries are only written when currency
+        # conversions left them unbalanced
+        super(AccountVoucher, self).balance_moves(
+            cr, uid, [shadow_move_id, voucher.move_id.id], ctx)
         return True
 
     def action_move_line_create(self, cr, uid, ids, context=None):
         if context is None:
             context = {}
-        journal_pool = self.pool.get('account.journal')
+        move_pool = self.pool.get('account.move')
         res = False
-        for voucher in self.browse(cr, uid, ids, context):
-            entry_posted = voucher.journal_id.entry_posted
-            # disable the 'skip draft state' option because "mixed" entry
-            # (shadow + real) won't pass validation. Anyway every entry will be
-            # posted later (if 'entry_posted' is enabled)
-            if entry_posted:
-                journal_pool.write(
-                    cr, uid, voucher.journal_id.id, {'entry_posted': False})
+        # already done, as by account_voucher. This happens when the
+        # workflow is moved forward after a batch posting
+        vouchers = [
+            voucher for voucher in self.browse(cr, uid, ids, context)
+            if not voucher.move_id
+        ]
+        # voucher lines don't change while posting: classify once
+        vat_on_payment = self.classify_vat_on_payment(
+            cr, uid, [voucher.id for voucher in vouchers], context=context)
+        post_ctx = dict(context, vat_on_payment_post=True)
+        pending_ctx = dict(context, vat_on_payment_pending=True)
+        vat_on_payment_ids = []
+        for voucher in vouchers:
+            if not vat_on_payment[voucher.id]:
+                res = super(AccountVoucher, self).action_move_line_create(
+                    cr, uid, [voucher.id], context)
+                continue
+            # the payment entry is created as pending, so that it's not
+            # posted, see account.move post, before its shadow entry is
+            # generated. If journal has 'skip draft state', both entries
+            # are posted here, once complete
             res = super(AccountVoucher, self).action_move_line_create(
-                cr, uid, [voucher.id], context)
+                cr, uid, [voucher.id], pending_ctx)
+            vat_on_payment_ids.append(voucher.id)
             # because 'move_id' has been updated by 'action_move_line_create'
             voucher.refresh()
-            if self.is_vat_on_payment(voucher):
-                self._create_vat_on_payment_move(
-                    cr, uid, voucher, context=context)
-            if entry_posted:
-                journal_pool.write(
-                    cr, uid, voucher.journal_id.id, {'entry_posted': True})
-                voucher.move_id.post()
-                if self.is_vat_on_payment(voucher):
-                    voucher.shadow_move_id.post()
+            self._create_vat_on_payment_move(
+                cr, uid, voucher, context=context)
+            if voucher.journal_id.entry_posted:
+                voucher.refresh()
+                move_pool.post(
+                    cr, uid,
+                    [voucher.move_id.id, voucher.shadow_move_id.id],
+                    context=post_ctx)
+        if vat_on_payment_ids:
+            self.pool.get('account.vat.on.payment.snapshot').update_snapshots(
+                cr, uid, [
+                    move_id
+                    for moves in self._get_vat_on_payment_moves(
+                        cr, uid, vat_on_payment_ids, context=context)
+                    for move_id in moves],
+                context=context)
+        return res
+
+    def account_move_get(self, cr, uid, voucher_id, context=None):
+        res = super(AccountVoucher, self).account_move_get(
+            cr, uid, voucher_id, context=context)
+        if (context or {}).get('vat_on_payment_pending'):
+            res['vat_on_payment_pending'] = True
+        return res
 
+    def _partition_by_company(self, cr, uid, ids, context=None):
+        """Return {company_id: voucher ids}"""
+        res = {}
+        if not ids:
+            return res
+        cr.execute("""
+            SELECT company_id, id FROM account_voucher
+            WHERE id IN %s ORDER BY company_id, id
+            """, (tuple(ids), ))
+        for company_id, voucher_id in cr.fetchall():
+            res.setdefault(company_id, []).append(voucher_id)
         return res
 
+    def _post_company_vouchers(self, uid, jobs, results, context=None):
+        """
+        Worker thread: post the vouchers of the (company_id, ids) jobs
+        taken from the queue, each company as a batch in its own
+        transaction, committed when done. The outcome is stored in
+        results[company_id]: False, or the error message
+        """
+        with api.Environment.manage():
+            while True:
+                try:
+                    company_id, ids = jobs.get_nowait()
+                except Queue.Empty:
+                    return
+                new_cr = self.pool.cursor()
+                try:
+                    stats = self.action_move_line_create_batch(
+                        new_cr, uid, ids,
+                        context=dict(context or {}, force_company=company_id))
+                    new_cr.commit()
+                    results[company_id] = False
+                    _logger.info(
+                        "VAT on payment: company %s, %d vouchers posted",
+                        company_id, stats['vouchers'])
+                except Exception as e:
+                    new_cr.rollback()
+                    results[company_id] = tools.ustr(e) or repr(e)
+                    _logger.exception(
+                        "VAT on payment: posting vouchers of company %s "
+                        "failed", company_id)
+                finally:
+                    new_cr.close()
+
+    def post_vouchers_by_company(
+        self, cr, uid, ids, use_new_cursor=False, max_workers=None,
+        context=None
+    ):
+        """
+        Post vouchers of several companies, one independent batch by
+        company, with the company in context.
+        With use_new_cursor, companies are posted in parallel by at most
+        max_workers threads, each with its own cursor and one transaction
+        by company: vouchers must be committed before, and a company
+        failing doesn't roll back the other ones. Workers are capped to half
+        the database connections (db_maxconn), so that they don't exhaust
+        the pool.
+        Otherwise companies are posted one after the other in the current
+        transaction, and any error is raised.
+        Return {company_id: {'voucher_ids': ids, 'error': False or the
+        error message}}
+        """
+        partitions = self._partition_by_company(
+            cr, uid, ids, context=context)
+        results = dict.fromkeys(partitions, False)
+        if use_new_cursor:
+            workers = max(1, min(
+                len(partitions), max_workers or len(partitions),
+                tools.config['db_maxconn'] // 2))
+            jobs = Queue.Queue()
+            for job in sorted(partitions.iteritems()):
+                jobs.put(job)
+            threads = [
+                threading.Thread(
+                    target=self._post_company_vouchers,
+                    args=(uid, jobs, results), kwargs={'context': context})
+                for index in range(workers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            for company_id, company_voucher_ids in sorted(
+                partitions.iteritems()
+            ):
+                self.action_move_line_create_batch(
+                    cr, uid, company_voucher_ids,
+                    context=dict(context or {}, force_company=company_id))
+        return dict(
+            (company_id, {
+                'voucher_ids': company_voucher_ids,
+                'error': results[company_id],
+            }) for company_id, company_voucher_ids in partitions.iteritems())
+
+    def _get_vat_on_payment_moves(self, cr, uid, ids, context=None):
+        """Return the (real entry, shadow entry) pairs of the vouchers"""
+        if not ids:
+            return []
+        cr.execute("""
+            SELECT move_id, shadow_move_id FROM account_voucher
+            WHERE id IN %s AND shadow_move_id IS NOT NULL
+            """, (tuple(ids), ))
+        return cr.fetchall()
+
     def cancel_voucher(self, cr, uid, ids, context=None):
+        reconcile_pool = self.pool.get('account.move.reconcile')
+        move_pool = self.pool.get('account.move')
+        # shadow entries and reconciliations of every voucher are gathered
+        # with one query each, then removed together. Real entries are
+        # still unreconciled and deleted voucher by voucher by
+        # account_voucher
+        moves = self._get_vat_on_payment_moves(cr, uid, ids, context=context)
+        self.pool.get('account.vat.on.payment.snapshot').update_snapshots(
+            cr, uid, [
+                move_id for pair in moves for move_id in pair if move_id],
+            sign=-1, context=context)
         res = super(AccountVoucher, self).cancel_voucher(
             cr, uid, ids, context)
-        reconcile_pool = self.pool.get('account.move.reconcile')
+        shadow_move_ids = sorted(set(pair[1] for pair in moves))
+        if not shadow_move_ids:
+            return res
+        cr.execute("""
+            SELECT reconcile_id FROM account_move_line
+            WHERE move_id IN %s AND reconcile_id IS NOT NULL
+            UNION
+            SELECT reconcile_partial_id FROM account_move_line
+            WHERE move_id IN %s AND reconcile_partial_id IS NOT NULL
+            """, (tuple(shadow_move_ids), tuple(shadow_move_ids)))
+        recs = [row[0] for row in cr.fetchall()]
+        if recs:
+            reconcile_pool.unlink(cr, uid, recs)
+        move_pool.button_cancel(cr, uid, shadow_move_ids)
+        move_pool.unlink(cr, uid, shadow_move_ids)
+        return res
+
+    def _get_stored_vat_on_payment_lines(self, cr, uid, voucher, context=None):
+        """
+        Return the (real lines, shadow lines) the voucher generated: real
+        entry lines apart from liquidity and kept write-off, shadow entry
+        lines on shadow accounts
+        """
+        shadow_account_ids = set(
+            shadow_id for account_type, shadow_id in self.pool.get(
+                'res.company').get_vat_on_payment_config(
+                    cr, voucher.company_id.id)['accounts'].itervalues()
+            if shadow_id)
+        keep_write_off = (
+            voucher.exclude_write_off
+            and voucher.payment_option == 'with_writeoff'
+        )
+        real_lines = [
+            line for line in voucher.move_id.line_id
+            if line.account_id.type != 'liquidity'
+            and not (
+                keep_write_off
+                and line.account_id.id == voucher.writeoff_acc_id.id)
+        ]
+        shadow_lines = [
+            line for line in voucher.shadow_move_id.line_id
+            if line.account_id.id in shadow_account_ids
+        ]
+        return real_lines, shadow_lines
+
+    def _diff_vat_on_payment_lines(
+        self, cr, uid, expected, stored, currency, context=None
+    ):
+        """
+        Compare expected lines values with stored move lines, by account and
+        tax code. The rounding difference put on one line by balance_moves
+        is tolerated: up to the currency rounding for every expected line.
+        Return a list of (account_id, tax_code_id, expected balance, stored
+        balance, expected tax amount, stored tax amount)
+        """
+        totals = {}
+        for vals in expected:
+            key = (vals['account_id'], vals.get('tax_code_id') or False)
+            total = totals.setdefault(key, [0.0, 0.0, 0.0, 0.0])
+            total[0] += vals.get('debit', 0.0) - vals.get('credit', 0.0)
+            total[2] += vals.get('tax_amount', 0.0)
+        for line in stored:
+            key = (line.account_id.id, line.tax_code_id.id or False)
+            total = totals.setdefault(key, [0.0, 0.0, 0.0, 0.0])
+            total[1] += line.debit - line.credit
+            total[3] += line.tax_amount
+        tolerance = currency.rounding * max(len(expected), 1)
+        return [
+            key + tuple(total) for key, total in sorted(totals.iteritems())
+            if abs(total[0] - total[1]) > tolerance
+            or abs(total[2] - total[3]) > tolerance
+        ]
+
+    def check_vat_on_payment_moves(self, cr, uid, voucher, context=None):
+        """
+        Return the list of differences between the entries of a posted
+        'VAT on payment' voucher and the ones it should generate
+        """
+        if not voucher.shadow_move_id:
+            return [_('Shadow entry is missing')]
+        expected_real, expected_shadow = self._get_vat_on_payment_lines(
+            cr, uid, voucher, context=context)
+        stored_real, stored_shadow = self._get_stored_vat_on_payment_lines(
+            cr, uid, voucher, context=context)
+        currency = voucher.company_id.currency_id
+        res = []
+        for entry, expected, stored in (
+            (_('Real entry'), expected_real, stored_real),
+            (_('Shadow entry'), expected_shadow, stored_shadow),
+        ):
+            for (account_id, tax_code_id, expected_balance, stored_balance,
+                 expected_tax, stored_tax) in self._diff_vat_on_payment_lines(
+                    cr, uid, expected, stored, currency, context=context):
+                res.append(
+                    _('%s: account %s, tax code %s: balance %s instead of '
+                      '%s, tax amount %s instead of %s') % (
+                        entry, account_id, tax_code_id or '-',
+                        stored_balance, expected_balance, stored_tax,
+                        expected_tax))
+        return res
+
+    def _repair_vat_on_payment_moves(self, cr, uid, voucher, context=None):
+        """
+        Generate the 'VAT on payment' lines of the voucher again. Posted
+        entries are cancelled, so their journal must allow it, and posted
+        again
+        """
+        if context is None:
+            context = {}
         move_pool = self.pool.get('account.move')
-        for voucher in self.browse(cr, uid, ids, context=context):
-            recs = []
-            if voucher.shadow_move_id:
-                for line in voucher.shadow_move_id.line_id:
-                    if line.reconcile_id:
-                        recs += [line.reconcile_id.id]
-                    if line.reconcile_partial_id:
-                        recs += [line.reconcile_partial_id.id]
-
-                reconcile_pool.unlink(cr, uid, recs)
-
-                if voucher.shadow_move_id:
-                    move_pool.button_cancel(
-                        cr, uid, [voucher.shadow_move_id.id])
-                    move_pool.unlink(cr, uid, [voucher.shadow_move_id.id])
+        move_line_pool = self.pool.get('account.move.line')
+        snapshot_pool = self.pool.get('account.vat.on.payment.snapshot')
+        # a pending entry was left draft, waiting for its shadow entry
+        posted = voucher.move_id.state == 'posted' or (
+            voucher.move_id.vat_on_payment_pending and
+            voucher.journal_id.entry_posted)
+        post_ctx = dict(context, vat_on_payment_post=True)
+        if not voucher.shadow_move_id:
+            if posted:
+                move_pool.button_cancel(
+                    cr, uid, [voucher.move_id.id], context=context)
+            self._create_vat_on_payment_move(
+                cr, uid, voucher, context=context)
+            voucher.refresh()
+            move_ids = [voucher.move_id.id, voucher.shadow_move_id.id]
+            if posted:
+                move_pool.post(cr, uid, move_ids, context=post_ctx)
+            snapshot_pool.update_snapshots(
+                cr, uid, move_ids, context=context)
+            return True
+        move_ids = [voucher.move_id.id, voucher.shadow_move_id.id]
+        snapshot_pool.update_snapshots(
+            cr, uid, move_ids, sign=-1, context=context)
+        if posted:
+            move_pool.button_cancel(cr, uid, move_ids, context=context)
+        stored_real, stored_shadow = self._get_stored_vat_on_payment_lines(
+            cr, uid, voucher, context=context)
+        expected_real, expected_shadow = self._get_vat_on_payment_lines(
+            cr, uid, voucher, context=context)
+        move_line_pool.unlink(
+            cr, uid, [line.id for line in stored_real + stored_shadow],
+            context=context)
+        for move, lines in (
+            (voucher.move_id, expected_real),
+            (voucher.shadow_move_id, expected_shadow),
+        ):
+            ctx = dict(
+                context, journal_id=move.journal_id.id,
+                period_id=move.period_id.id)
+            move_pool.write(cr, uid, [move.id], {
+                'line_id': [(0, 0, vals) for vals in lines],
+            }, context=ctx)
+        super(AccountVoucher, self).balance_moves(
+            cr, uid, move_ids, context)
+        if posted:
+            move_pool.post(cr, uid, move_ids, context=post_ctx)
+        snapshot_pool.update_snapshots(cr, uid, move_ids, context=context)
+        return True
+
+    def repair_vat_on_payment_moves(
+        self, cr, uid, ids, dry_run=True, batch_size=100, context=None
+    ):
+        """
+        Check, and unless dry_run repair, the entries of the given posted
+        'VAT on payment' vouchers. Vouchers are processed by batches of
+        batch_size, so that the cache doesn't grow with the number of
+        vouchers. Return a dictionary {voucher_id: list of differences}
+        with the vouchers that were out of sync
+        """
+        res = {}
+        start = time.time()
+        done = 0
+        ids = sorted(ids)
+        for index in range(0, len(ids), batch_size):
+            batch_ids = ids[index:index + batch_size]
+            vat_on_payment = self.classify_vat_on_payment(
+                cr, uid, batch_ids, context=context)
+            for voucher in self.browse(cr, uid, [
+                voucher_id for voucher_id in batch_ids
+                if vat_on_payment[voucher_id]
+            ], context=context):
+                if voucher.state != 'posted' or not voucher.move_id:
+                    continue
+                differences = self.check_vat_on_payment_moves(
+                    cr, uid, voucher, context=context)
+                if not differences:
+                    continue
+                res[voucher.id] = differences
+                if not dry_run:
+                    self._repair_vat_on_payment_moves(
+                        cr, uid, voucher, context=context)
+            done += len(batch_ids)
+            # lines read by this batch are not needed anymore
+            self.invalidate_cache(cr, uid, context=context)
+            elapsed = time.time() - start
+            _logger.info(
+                "VAT on payment %s: %d/%d vouchers, %d out of sync, "
+                "%.1f vouchers/s",
+                dry_run and 'check' or 'repair', done, len(ids), len(res),
+                elapsed and done / elapsed or 0.0)
         return res
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+"""Cancellation of posted 'VAT on payment' receipts.
+
+Each size posts that many receipts, one per invoice, then cancels all of
+them with a single ``cancel_voucher`` call, which removes the shadow
+entries and their reconciliations.
+"""
+
+from openerp import SUPERUSER_ID
+
+from common import (
+    DataFactory, bench_cursor, measure, parse_args, print_table)
+
+
+def main():
+    args = parse_args(__doc__, [100, 1000, 3000])
+    rows = []
+    for size in args.sizes:
+        with bench_cursor() as (registry, cr):
+            factory = DataFactory(registry, cr)
+            invoice_ids = factory.create_invoices(size)
+            voucher_ids = factory.create_receipts(invoice_ids, 120.0)
+            factory.post_receipts(voucher_ids)
+            results = {}
+            with measure(cr, results, 'cancel'):
+                registry['account.voucher'].cancel_voucher(
+                    cr, SUPERUSER_ID, voucher_ids)
+            seconds, queries = results['cancel']
+            rows.append((
+                size, '%.2f' % seconds, queries,
+                '%.1f' % (size / seconds if seconds else 0.0)))
+    print_table(('vouchers', 'seconds', 'queries', 'vouchers/s'), rows)
+
+
+if __name__ == '__main__':
+    main()
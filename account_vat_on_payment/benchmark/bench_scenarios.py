@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+"""Replay of the YAML test scenarios (test/account_invoice_*.yml), scaled.
+
+Each scenario validates N invoices, pays them with M receipts for each
+payment of the scenario, then cancels every receipt. Wall time and SQL
+queries of the hot paths are reported by scenario and size; with --csv
+they are also written to a file, to compare runs.
+"""
+
+import csv
+
+from openerp import SUPERUSER_ID
+
+from common import DataFactory, Probe, bench_cursor, parse_args, print_table
+
+# (model, method) measured in every scenario
+PROBES = [
+    ('account.invoice', 'finalize_invoice_move_lines'),
+    ('account.voucher', 'action_move_line_create'),
+    ('account.voucher', '_create_vat_on_payment_move'),
+    ('account.voucher', 'balance_moves'),
+    ('account.voucher', 'cancel_voucher'),
+]
+
+# One payment by dict: amount received for every invoice, amount allocated
+# to it (the difference is written off), journal and write-off settings
+SCENARIOS = [
+    ('1_full_payment', {
+        'payments': [{'amount': 120.0}],
+    }),
+    ('2_partial_payments', {
+        'payments': [
+            {'amount': 50.0, 'reconcile': False},
+            {'amount': 70.0},
+        ],
+    }),
+    ('3_two_taxes', {
+        'lines': ((100.0, 20.0), (100.0, 10.0)),
+        'payments': [
+            {'amount': 100.0, 'reconcile': False},
+            {'amount': 130.0},
+        ],
+    }),
+    ('4_write_off', {
+        'payments': [{
+            'amount': 100.0, 'line_amount': 120.0,
+            'writeoff_xml_id': 'account.a_expense',
+        }],
+    }),
+    ('5_usd', {
+        'currency': 'base.USD',
+        'payments': [{
+            'amount': 120.0, 'journal_xml_id': 'account.bank_journal_usd',
+        }],
+    }),
+    ('6_usd_write_off', {
+        'currency': 'base.USD',
+        'payments': [{
+            'amount': 100.0, 'line_amount': 120.0,
+            'journal_xml_id': 'account.bank_journal_usd',
+            'writeoff_xml_id': 'account.a_expense',
+        }],
+    }),
+    ('7_usd_paid_in_eur', {
+        'currency': 'base.USD',
+        'payments': [{
+            'amount': 30.0, 'line_amount': 60.0,
+            'writeoff_xml_id': 'account.income_fx_expense',
+        }],
+    }),
+    ('8_excluded_write_off_skip_draft', {
+        'entry_posted': True,
+        'payments': [{
+            'amount': 100.0, 'line_amount': 120.0,
+            'writeoff_xml_id': 'account.a_expense',
+            'exclude_write_off': True,
+        }],
+    }),
+    ('9_no_vat_on_payment', {
+        'vat_on_payment': False,
+        'payments': [{'amount': 120.0}],
+    }),
+]
+
+
+def run_scenario(registry, cr, scenario, invoices, vouchers):
+    uid = SUPERUSER_ID
+    factory = DataFactory(registry, cr)
+    factory.set_usd_rates()
+    if scenario.get('entry_posted'):
+        registry['account.journal'].write(
+            cr, uid, [factory.ref('account.bank_journal')],
+            {'entry_posted': True})
+    currency_id = scenario.get('currency') and factory.ref(
+        scenario['currency'])
+    invoice_ids = factory.create_invoices(
+        invoices, lines=scenario.get('lines', ((100.0, 20.0), )),
+        vat_on_payment=scenario.get('vat_on_payment', True),
+        currency_id=currency_id)
+    voucher_ids = []
+    for payment in scenario['payments']:
+        payment_ids = factory.create_receipts(
+            invoice_ids, vouchers=vouchers, **payment)
+        factory.post_receipts(payment_ids)
+        voucher_ids += payment_ids
+    # last ones first, as a user would do
+    registry['account.voucher'].cancel_voucher(
+        cr, uid, list(reversed(voucher_ids)))
+
+
+def main():
+    parser_args = parse_args(__doc__, [10, 100], extra_options=[
+        (('--vouchers', ), {
+            'type': int, 'default': 0,
+            'help': "receipts by payment, default one by invoice"}),
+        (('--scenarios', ), {
+            'default': '',
+            'help': "comma separated names, default all"}),
+        (('--csv', ), {'default': '', 'help': "file to write results to"}),
+    ])
+    names = [name for name in parser_args.scenarios.split(',') if name]
+    header = (
+        'scenario', 'invoices', 'vouchers', 'method', 'calls', 'seconds',
+        'queries', 'ms/call', 'queries/call')
+    rows = []
+    for name, scenario in SCENARIOS:
+        if names and name not in names:
+            continue
+        for size in parser_args.sizes:
+            vouchers = min(parser_args.vouchers or size, size)
+            with bench_cursor() as (registry, cr):
+                probe = Probe()
+                for model, method in PROBES:
+                    probe.watch(registry[model], method)
+                try:
+                    run_scenario(registry, cr, scenario, size, vouchers)
+                finally:
+                    probe.restore()
+            for model, method in PROBES:
+                key = '%s.%s' % (model, method)
+                calls, seconds, queries = probe.stats.get(key, (0, 0.0, 0))
+                rows.append((
+                    name, size, vouchers, key, calls, '%.3f' % seconds,
+                    queries,
+                    '%.2f' % (calls and seconds * 1000 / calls or 0.0),
+                    '%.1f' % (calls and float(queries) / calls or 0.0)))
+    print_table(header, rows)
+    if parser_args.csv:
+        with open(parser_args.csv, 'w') as output:
+            writer = csv.writer(output)
+            writer.writerow(header)
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
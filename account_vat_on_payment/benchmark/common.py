@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+"""Helpers shared by the benchmark scripts of account_vat_on_payment.
+
+The scripts are run by hand against a database where the module is
+installed with demo data, e.g.::
+
+    python bench_cancel_voucher.py -d bench --addons-path=... --sizes=100,1000
+
+Everything is done in one transaction which is rolled back at the end, so
+the database is left untouched.
+"""
+
+import argparse
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import openerp
+from openerp import SUPERUSER_ID
+from openerp.tools import config
+
+
+def parse_args(description, default_sizes, extra_options=()):
+    """Split our own options from the server ones (database, addons path,
+    ...) which are handed over to the configuration parser.
+    extra_options are (args, kwargs) of argparse add_argument"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--sizes', default=','.join(str(s) for s in default_sizes),
+        help="comma separated list of dataset sizes")
+    for option_args, option_kwargs in extra_options:
+        parser.add_argument(*option_args, **option_kwargs)
+    args, server_args = parser.parse_known_args()
+    args.sizes = [int(s) for s in args.sizes.split(',') if s]
+    config.parse_config(server_args)
+    return args
+
+
+@contextmanager
+def bench_cursor():
+    """Cursor on the configured database, always rolled back"""
+    registry = openerp.modules.registry.RegistryManager.get(
+        config['db_name'])
+    cr = registry.cursor()
+    try:
+        yield registry, cr
+    finally:
+        cr.rollback()
+        cr.close()
+
+
+class Probe(object):
+    """Wall time and number of SQL queries of the wrapped model methods.
+
+    Methods are wrapped, for old and new API calls alike, on the last
+    class of the model that defines them, so that calls through super()
+    from overriding modules are counted too. ``restore`` puts them back.
+    Nested calls of a watched method are counted in each of them.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self._patched = []
+
+    def watch(self, model, method):
+        cls = [
+            klass for klass in type(model).__mro__
+            if method in vars(klass)][0]
+        orig = vars(cls)[method]
+        key = '%s.%s' % (model._name, method)
+        stats = self.stats
+
+        @wraps(orig)
+        def wrapper(self, *args, **kwargs):
+            cr = args[0] if args and hasattr(args[0], 'execute') \
+                else self._cr
+            count = cr.sql_log_count
+            start = time.time()
+            try:
+                return orig(self, *args, **kwargs)
+            finally:
+                calls, seconds, queries = stats.get(key, (0, 0.0, 0))
+                stats[key] = (
+                    calls + 1, seconds + time.time() - start,
+                    queries + cr.sql_log_count - count)
+
+        setattr(cls, method, wrapper)
+        self._patched.append((cls, method, orig))
+
+    def reset(self):
+        self.stats.clear()
+
+    def restore(self):
+        for cls, method, orig in reversed(self._patched):
+            setattr(cls, method, orig)
+        self._patched = []
+
+
+@contextmanager
+def measure(cr, results, label):
+    """Store (seconds, queries) of the block in results[label]"""
+    count = cr.sql_log_count
+    start = time.time()
+    yield
+    results[label] = (time.time() - start, cr.sql_log_count - count)
+
+
+def print_table(header, rows):
+    widths = [
+        max(len(str(row[i])) for row in [header] + rows)
+        for i in range(len(header))]
+    for row in [header] + rows:
+        print('  '.join(
+            str(value).rjust(width) for value, width in zip(row, widths)))
+
+
+class DataFactory(object):
+    """
+    Customer invoices and receipts on the demo data of the module, like
+    the ones of the YAML tests
+    """
+
+    def __init__(self, registry, cr, uid=SUPERUSER_ID, context=None):
+        self.pool = registry
+        self.cr = cr
+        self.uid = uid
+        self.context = context or {}
+        self.data_model = registry['ir.model.data']
+        self.year = time.strftime('%Y')
+        self.tax_ids = self._create_taxes()
+
+    def ref(self, xml_id):
+        module, name = xml_id.split('.')
+        return self.data_model.get_object_reference(
+            self.cr, self.uid, module, name)[1]
+
+    def _create_taxes(self):
+        """Fixed taxes of 10 and 20 on a tax code with a shadow one"""
+        cr, uid = self.cr, self.uid
+        tax_code_model = self.pool['account.tax.code']
+        company_id = self.ref('base.main_company')
+        shadow_id = tax_code_model.create(cr, uid, {
+            'name': 'Benchmark tax received (shadow)',
+            'company_id': company_id,
+        })
+        tax_code_id = tax_code_model.create(cr, uid, {
+            'name': 'Benchmark tax received',
+            'company_id': company_id,
+            'vat_on_payment_related_tax_code_id': shadow_id,
+        })
+        res = {}
+        for amount in (10.0, 20.0):
+            res[amount] = self.pool['account.tax'].create(cr, uid, {
+                'name': 'Benchmark tax %s' % amount,
+                'amount': amount,
+                'type': 'fixed',
+                'company_id': company_id,
+                'type_tax_use': 'all',
+                'tax_code_id': tax_code_id,
+                'account_collected_id': self.ref('account.iva'),
+            })
+        return res
+
+    @property
+    def invoice_date(self):
+        return '%s-08-14' % self.year
+
+    @property
+    def payment_date(self):
+        return '%s-08-15' % self.year
+
+    def set_usd_rates(self):
+        """1 EUR = 2 USD at invoice date, 4 USD at payment date"""
+        cr, uid = self.cr, self.uid
+        rate_model = self.pool['res.currency.rate']
+        usd_id = self.ref('base.USD')
+        for date, rate in ((self.invoice_date, 2), (self.payment_date, 4)):
+            rate_ids = rate_model.search(cr, uid, [
+                ('currency_id', '=', usd_id), ('name', '=', date)])
+            if rate_ids:
+                rate_model.write(cr, uid, rate_ids, {'rate': rate})
+            else:
+                rate_model.create(cr, uid, {
+                    'currency_id': usd_id, 'name': date, 'rate': rate})
+
+    def create_invoices(self, count, lines=((100.0, 20.0), ),
+                        vat_on_payment=True, currency_id=False):
+        """
+        Validated invoices, with one line by (price, tax amount) of
+        ``lines``
+        """
+        cr, uid = self.cr, self.uid
+        invoice_model = self.pool['account.invoice']
+        vals = {
+            'journal_id': self.ref('account.sales_journal'),
+            'partner_id': self.ref('base.res_partner_3'),
+            'account_id': self.ref('account.a_recv'),
+            'date_invoice': self.invoice_date,
+            'vat_on_payment': vat_on_payment,
+        }
+        if currency_id:
+            vals['currency_id'] = currency_id
+        invoice_ids = []
+        for i in range(count):
+            invoice_ids.append(invoice_model.create(cr, uid, dict(
+                vals, invoice_line=[(0, 0, {
+                    'name': 'Benchmark service %s' % i,
+                    'quantity': 1,
+                    'price_unit': price,
+                    'account_id': self.ref('account.a_sale'),
+                    'invoice_line_tax_id': [(6, 0, [self.tax_ids[tax]])],
+                }) for price, tax in lines]), context=self.context))
+        invoice_model.signal_workflow(
+            cr, uid, invoice_ids, 'invoice_open', context=self.context)
+        return invoice_ids
+
+    def create_receipts(self, invoice_ids, amount, line_amount=None,
+                        reconcile=True, vouchers=None, journal_xml_id=None,
+                        writeoff_xml_id=None, exclude_write_off=False):
+        """
+        Receipts of ``amount`` for each invoice, allocating ``line_amount``
+        (default amount) to it; the difference is written off.
+        Invoices are split into ``vouchers`` receipts, one per invoice by
+        default
+        """
+        cr, uid = self.cr, self.uid
+        voucher_model = self.pool['account.voucher']
+        journal = self.pool['account.journal'].browse(
+            cr, uid, self.ref(journal_xml_id or 'account.bank_journal'))
+        ctx = dict(self.context, type='receipt', journal_id=journal.id)
+        if line_amount is None:
+            line_amount = amount
+        vouchers = vouchers or len(invoice_ids)
+        size = -(-len(invoice_ids) // vouchers)
+        invoices = self.pool['account.invoice'].browse(cr, uid, invoice_ids)
+        voucher_ids = []
+        for index in range(0, len(invoices), size):
+            group = invoices[index:index + size]
+            vals = {
+                'type': 'receipt',
+                'partner_id': group[0].partner_id.id,
+                'journal_id': journal.id,
+                'account_id': journal.default_debit_account_id.id,
+                'date': self.payment_date,
+                'amount': amount * len(group),
+                'line_cr_ids': [(0, 0, {
+                    'type': 'cr',
+                    'move_line_id': [
+                        line for line in invoice.move_id.line_id
+                        if line.account_id == invoice.account_id][0].id,
+                    'account_id': invoice.account_id.id,
+                    'amount': line_amount,
+                    'reconcile': reconcile,
+                }) for invoice in group],
+            }
+            if writeoff_xml_id:
+                vals.update({
+                    'payment_option': 'with_writeoff',
+                    'writeoff_acc_id': self.ref(writeoff_xml_id),
+                    'exclude_write_off': exclude_write_off,
+                })
+            voucher_ids.append(voucher_model.create(cr, uid, vals, ctx))
+        return voucher_ids
+
+    def post_receipts(self, voucher_ids):
+        self.pool['account.voucher'].signal_workflow(
+            self.cr, self.uid, voucher_ids, 'proforma_voucher',
+            context=dict(self.context, type='receipt'))
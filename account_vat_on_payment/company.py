@@ -20,7 +20,25 @@
 #
 ##############################################################################
 
+from openerp import tools
 from openerp.osv import orm, fields
+from openerp.tools.translate import _
+
+
+def _find_cycles(mapping):
+    """Return the ids of mapping {id: related id} that lead back to
+    themselves"""
+    res = set()
+    for record_id in mapping:
+        seen = set()
+        current = record_id
+        while current in mapping and current not in seen:
+            seen.add(current)
+            current = mapping[current]
+            if current == record_id:
+                res.add(record_id)
+                break
+    return res
 
 
 class ResCompany(orm.Model):
@@ -28,3 +46,204 @@ class ResCompany(orm.Model):
     _columns = {
         'vat_on_payment': fields.boolean('VAT on payment treatment'),
     }
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if 'vat_on_payment' in vals:
+            self.clear_caches()
+        return super(ResCompany, self).write(
+            cr, uid, ids, vals, context=context)
+
+    @tools.ormcache(skiparg=2)
+    def get_vat_on_payment_config(self, cr, company_id):
+        """
+        Return the 'VAT on payment' configuration of the company:
+        - vat_on_payment: flag of the company
+        - accounts: {account_id: (type, shadow account id)}, every account
+        - tax_codes: {tax_code_id: shadow tax code id}
+        - journals: {journal_id: shadow journal id}
+        Loaded once per company, cleared when companies, journals, accounts
+        or tax codes change
+        """
+        cr.execute(
+            "SELECT vat_on_payment FROM res_company WHERE id = %s",
+            (company_id, ))
+        res = {'vat_on_payment': cr.fetchone()[0]}
+        cr.execute("""
+            SELECT id, type, vat_on_payment_related_account_id
+            FROM account_account
+            WHERE company_id = %s
+            """, (company_id, ))
+        res['accounts'] = dict(
+            (account_id, (account_type, shadow_id))
+            for account_id, account_type, shadow_id in cr.fetchall())
+        for key, table, column in (
+            ('journals', 'account_journal',
+             'vat_on_payment_related_journal_id'),
+            ('tax_codes', 'account_tax_code',
+             'vat_on_payment_related_tax_code_id'),
+        ):
+            cr.execute("""
+                SELECT id, %s FROM %s
+                WHERE company_id = %%s AND %s IS NOT NULL
+                """ % (column, table, column), (company_id, ))
+            res[key] = dict(cr.fetchall())
+        return res
+
+    def _check_vat_on_payment_model_mappings(
+        self, cr, uid, records, mapping, required_ids, record_label,
+        context=None
+    ):
+        """
+        records: {id: (name, company_id)} of the whole model
+        mapping: {id: related shadow id}
+        Return [(company_id, message)]
+        """
+        problems = []
+        for record_id in sorted(required_ids):
+            if record_id in records and not mapping.get(record_id):
+                name, company_id = records[record_id]
+                problems.append((company_id, _(
+                    "%s %s does not have a related shadow %s")
+                    % (record_label, name, record_label.lower())))
+        for record_id in sorted(_find_cycles(mapping)):
+            name, company_id = records[record_id]
+            problems.append((company_id, _(
+                "%s %s has a circular shadow mapping")
+                % (record_label, name)))
+        for record_id, shadow_id in sorted(mapping.iteritems()):
+            if (
+                shadow_id in records
+                and records[shadow_id][1] != records[record_id][1]
+            ):
+                name, company_id = records[record_id]
+                problems.append((company_id, _(
+                    "%s %s has a shadow %s of another company")
+                    % (record_label, name, record_label.lower())))
+        return problems
+
+    def check_vat_on_payment_mappings(self, cr, uid, ids, context=None):
+        """
+        Scan the whole chart of the given 'VAT on payment' companies, with
+        a few queries per model, and return {company_id: [problems]}:
+        accounts invoice lines can hit (income and expense accounts,
+        product and category accounts, fiscal position and tax accounts)
+        and tax codes used by taxes without shadow mapping, bank and cash
+        journals without shadow journal, circular mappings and mappings to
+        another company
+        """
+        report = {}
+        if not ids:
+            return report
+        cr.execute("""
+            SELECT id FROM res_company
+            WHERE id IN %s AND vat_on_payment
+            """, (tuple(ids), ))
+        company_ids = set(row[0] for row in cr.fetchall())
+        if not company_ids:
+            return report
+
+        cr.execute("""
+            SELECT a.id, a.code || ' ' || a.name, a.company_id,
+                a.vat_on_payment_related_account_id,
+                a.active AND a.type = 'other'
+                    AND t.report_type IN ('income', 'expense')
+            FROM account_account a
+            LEFT JOIN account_account_type t ON t.id = a.user_type
+            """)
+        accounts = {}
+        account_mapping = {}
+        # invoice lines on any account but receivable and payable ones are
+        # moved to the shadow account: the ones invoice lines can hit are
+        # income and expense accounts, product and category accounts,
+        # accounts of fiscal positions and tax accounts
+        required_account_ids = set()
+        for account_id, name, company_id, shadow_id, profit_loss in (
+            cr.fetchall()
+        ):
+            accounts[account_id] = (name, company_id)
+            if shadow_id:
+                account_mapping[account_id] = shadow_id
+            if profit_loss:
+                required_account_ids.add(account_id)
+        cr.execute("""
+            SELECT value_reference FROM ir_property
+            WHERE name IN %s AND value_reference LIKE 'account.account,%%'
+            """, (('property_account_income', 'property_account_expense',
+                   'property_account_income_categ',
+                   'property_account_expense_categ'), ))
+        required_account_ids.update(
+            int(row[0].split(',')[1]) for row in cr.fetchall()
+            if row[0].split(',')[1].isdigit())
+        cr.execute("""
+            SELECT account_src_id, account_dest_id
+            FROM account_fiscal_position_account
+            """)
+        for row in cr.fetchall():
+            required_account_ids.update(row)
+
+        cr.execute("""
+            SELECT id, name, company_id, vat_on_payment_related_tax_code_id
+            FROM account_tax_code
+            """)
+        tax_codes = {}
+        tax_code_mapping = {}
+        for tax_code_id, name, company_id, shadow_id in cr.fetchall():
+            tax_codes[tax_code_id] = (name, company_id)
+            if shadow_id:
+                tax_code_mapping[tax_code_id] = shadow_id
+
+        cr.execute("""
+            SELECT id, name, company_id, type,
+                vat_on_payment_related_journal_id
+            FROM account_journal
+            """)
+        journals = {}
+        journal_mapping = {}
+        required_journal_ids = set()
+        for journal_id, name, company_id, journal_type, shadow_id in (
+            cr.fetchall()
+        ):
+            journals[journal_id] = (name, company_id)
+            if shadow_id:
+                journal_mapping[journal_id] = shadow_id
+            if journal_type in ('bank', 'cash'):
+                required_journal_ids.add(journal_id)
+
+        # tax codes used by taxes are the ones shadow lines are generated
+        # for
+        cr.execute("""
+            SELECT account_collected_id, account_paid_id,
+                tax_code_id, base_code_id, ref_tax_code_id, ref_base_code_id
+            FROM account_tax
+            WHERE company_id IN %s
+            """, (tuple(company_ids), ))
+        required_tax_code_ids = set()
+        for row in cr.fetchall():
+            required_account_ids.update(
+                account_id for account_id in row[:2] if account_id)
+            required_tax_code_ids.update(
+                tax_code_id for tax_code_id in row[2:] if tax_code_id)
+        # shadow records are not expected to have a shadow themselves
+        required_account_ids = set(
+            account_id for account_id in required_account_ids
+            if account_id in accounts
+            and accounts[account_id][1] in company_ids
+        ) - set(account_mapping.values())
+        required_tax_code_ids -= set(tax_code_mapping.values())
+        required_journal_ids -= set(journal_mapping.values())
+
+        problems = (
+            self._check_vat_on_payment_model_mappings(
+                cr, uid, accounts, account_mapping, required_account_ids,
+                _('Account'), context=context) +
+            self._check_vat_on_payment_model_mappings(
+                cr, uid, tax_codes, tax_code_mapping, required_tax_code_ids,
+                _('Tax code'), context=context) +
+            self._check_vat_on_payment_model_mappings(
+                cr, uid, journals, journal_mapping, required_journal_ids,
+                _('Journal'), context=context)
+        )
+        for company_id, message in problems:
+            if company_id in company_ids:
+                report.setdefault(company_id, []).append(message)
+        return report
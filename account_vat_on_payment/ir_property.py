@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2011-2012 Domsense s.r.l. (<http://www.domsense.com>).
+#    Copyright (C) 2014 Agile Business Group sagl (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+
+from openerp.osv import orm
+
+FISCAL_POSITION_PROPERTY = 'property_account_position'
+
+
+class IrProperty(orm.Model):
+    _inherit = 'ir.property'
+
+    def _clear_vat_on_payment_caches(self, cr, uid, ids, context=None):
+        """Partners defaults of account.invoice follow fiscal positions"""
+        cr.execute(
+            "SELECT 1 FROM ir_property WHERE id IN %s AND name = %s LIMIT 1",
+            (tuple(ids), FISCAL_POSITION_PROPERTY))
+        if cr.fetchone():
+            self.pool.get('account.invoice').clear_caches()
+
+    def create(self, cr, uid, vals, context=None):
+        res = super(IrProperty, self).create(cr, uid, vals, context=context)
+        self._clear_vat_on_payment_caches(cr, uid, [res], context=context)
+        return res
+
+    def write(self, cr, uid, ids, vals, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        if ids:
+            # before, as the property may be renamed
+            self._clear_vat_on_payment_caches(cr, uid, ids, context=context)
+        res = super(IrProperty, self).write(
+            cr, uid, ids, vals, context=context)
+        if ids and 'name' in vals:
+            self._clear_vat_on_payment_caches(cr, uid, ids, context=context)
+        return res
+
+    def unlink(self, cr, uid, ids, context=None):
+        if isinstance(ids, (int, long)):
+            ids = [ids]
+        if ids:
+            self._clear_vat_on_payment_caches(cr, uid, ids, context=context)
+        return super(IrProperty, self).unlink(cr, uid, ids, context=context)
@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from . import test_move_payment_lines
+from . import test_mappings
+from . import test_snapshot
+from . import test_payment_moves
+from . import test_repair
+from . import test_defaults
+from . import test_split_line_amounts
+from . import test_auto_post
+from . import test_companies
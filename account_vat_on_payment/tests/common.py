@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from openerp.tests.common import TransactionCase
+
+
+class VatOnPaymentCase(TransactionCase):
+    """Customer invoices and receipts on demo data"""
+
+    def setUp(self):
+        super(VatOnPaymentCase, self).setUp()
+        self.invoice_model = self.registry('account.invoice')
+        self.voucher_model = self.registry('account.voucher')
+        self.partner = self.env.ref('base.res_partner_3')
+        self.bank_journal = self.env.ref('account.bank_journal')
+
+    def create_tax(self, amount):
+        """Percent tax on a tax code mapped to a shadow tax code"""
+        tax_code_model = self.registry('account.tax.code')
+        company_id = self.env.ref('base.main_company').id
+        shadow_tax_code_id = tax_code_model.create(self.cr, self.uid, {
+            'name': 'Tax received (shadow)',
+            'company_id': company_id,
+        })
+        tax_code_id = tax_code_model.create(self.cr, self.uid, {
+            'name': 'Tax received',
+            'company_id': company_id,
+            'vat_on_payment_related_tax_code_id': shadow_tax_code_id,
+        })
+        return self.registry('account.tax').create(self.cr, self.uid, {
+            'name': 'Tax %s' % amount,
+            'amount': amount,
+            'type': 'percent',
+            'company_id': company_id,
+            'type_tax_use': 'all',
+            'tax_code_id': tax_code_id,
+            'account_collected_id': self.env.ref('account.iva').id,
+        })
+
+    def create_invoice(self, amount, vat_on_payment=False, tax_ids=None):
+        cr, uid = self.cr, self.uid
+        invoice_id = self.invoice_model.create(cr, uid, {
+            'journal_id': self.env.ref('account.sales_journal').id,
+            'partner_id': self.partner.id,
+            'account_id': self.env.ref('account.a_recv').id,
+            'vat_on_payment': vat_on_payment,
+            'invoice_line': [(0, 0, {
+                'name': 'Service',
+                'quantity': 1,
+                'price_unit': amount,
+                'account_id': self.env.ref('account.a_sale').id,
+                'invoice_line_tax_id': [(6, 0, tax_ids or [])],
+            })],
+        })
+        self.invoice_model.signal_workflow(
+            cr, uid, [invoice_id], 'invoice_open')
+        return invoice_id
+
+    def create_receipt(self, amount):
+        """Receipt allocated, by account_voucher, to the open invoices of
+        the partner"""
+        cr, uid = self.cr, self.uid
+        ctx = {'type': 'receipt'}
+        res = self.voucher_model.onchange_partner_id(
+            cr, uid, [], self.partner.id, self.bank_journal.id, amount,
+            self.bank_journal.company_id.currency_id.id, 'receipt', False,
+            context=ctx)
+        return self.voucher_model.create(cr, uid, {
+            'type': 'receipt',
+            'partner_id': self.partner.id,
+            'journal_id': self.bank_journal.id,
+            'account_id': self.bank_journal.default_debit_account_id.id,
+            'amount': amount,
+            'line_cr_ids': [
+                (0, 0, vals) for vals in res['value']['line_cr_ids']],
+        }, context=ctx)
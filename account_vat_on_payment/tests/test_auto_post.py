@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from openerp.osv import orm
+
+from .common import VatOnPaymentCase
+
+
+class TestAutoPost(VatOnPaymentCase):
+
+    def setUp(self):
+        super(TestAutoPost, self).setUp()
+        self.move_model = self.registry('account.move')
+        # 'skip draft state': account_voucher posts the payment entry as
+        # soon as its lines balance
+        self.bank_journal.write({'entry_posted': True})
+        self.tax = self.registry('account.tax').browse(
+            self.cr, self.uid, self.create_tax(0.2))
+
+    def test_post_balanced_voucher(self):
+        cr, uid = self.cr, self.uid
+        self.create_invoice(100.0, vat_on_payment=True, tax_ids=[self.tax.id])
+        voucher_id = self.create_receipt(120.0)
+        self.voucher_model.signal_workflow(
+            cr, uid, [voucher_id], 'proforma_voucher')
+        voucher = self.voucher_model.browse(cr, uid, voucher_id)
+        for move in (voucher.move_id, voucher.shadow_move_id):
+            self.assertEqual(move.state, 'posted')
+            self.assertFalse(move.vat_on_payment_pending)
+        # real lines were added before the entry was posted
+        self.assertIn(
+            self.tax.tax_code_id, voucher.move_id.line_id.mapped(
+                'tax_code_id'))
+        self.assertEqual(
+            voucher.move_ids.mapped('account_id.type'), ['liquidity'])
+
+    def test_validate_pending_entry(self):
+        cr, uid = self.cr, self.uid
+        move_id = self.move_model.create(cr, uid, {
+            'journal_id': self.bank_journal.id,
+            'vat_on_payment_pending': True,
+        })
+        self.move_model.post(cr, uid, [move_id])
+        move = self.move_model.browse(cr, uid, move_id)
+        self.assertEqual(move.state, 'draft')
+        with self.assertRaises(orm.except_orm):
+            self.move_model.button_validate(cr, uid, [move_id])
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from .common import VatOnPaymentCase
+
+
+class TestCompanies(VatOnPaymentCase):
+
+    def test_company_config(self):
+        company_model = self.registry('res.company')
+        company = self.bank_journal.company_id
+        config = company_model.get_vat_on_payment_config(
+            self.cr, company.id)
+        self.assertEqual(
+            config['accounts'][self.env.ref('account.a_sale').id],
+            ('other', self.env.ref('account_vat_on_payment.pss').id))
+        company.vat_on_payment = not company.vat_on_payment
+        config = company_model.get_vat_on_payment_config(
+            self.cr, company.id)
+        self.assertEqual(config['vat_on_payment'], company.vat_on_payment)
+
+    def test_post_by_company(self):
+        cr, uid = self.cr, self.uid
+        voucher_ids = []
+        for i in range(2):
+            self.create_invoice(100.0, vat_on_payment=True)
+            voucher_ids.append(self.create_receipt(100.0))
+        partitions = self.voucher_model.post_vouchers_by_company(
+            cr, uid, voucher_ids)
+        self.assertEqual(partitions, {
+            self.bank_journal.company_id.id: {
+                'voucher_ids': voucher_ids,
+                'error': False,
+            }})
+        for voucher in self.voucher_model.browse(cr, uid, voucher_ids):
+            self.assertEqual(voucher.state, 'posted')
+            self.assertTrue(voucher.shadow_move_id)
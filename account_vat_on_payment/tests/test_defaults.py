@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from openerp.tests.common import TransactionCase
+
+
+class TestDefaults(TransactionCase):
+
+    def setUp(self):
+        super(TestDefaults, self).setUp()
+        self.invoice_model = self.registry('account.invoice')
+        self.company = self.env.ref('base.main_company')
+        self.position = self.env['account.fiscal.position'].create({
+            'name': 'VAT on payment',
+            'default_has_vat_on_payment': True,
+        })
+        self.partner = self.env.ref('base.res_partner_3')
+        self.partner.property_account_position = self.position
+        self.other_partner = self.env.ref('base.res_partner_4')
+        self.other_partner.property_account_position = False
+
+    def _onchange_default(self):
+        res = self.invoice_model.onchange_partner_id(
+            self.cr, self.uid, [], 'out_invoice', self.partner.id,
+            company_id=self.company.id)
+        return res['value'].get('vat_on_payment')
+
+    def test_partner_default(self):
+        self.assertTrue(self._onchange_default())
+        self.position.default_has_vat_on_payment = False
+        self.assertFalse(self._onchange_default())
+        self.partner.property_account_position = False
+        self.assertIsNone(self._onchange_default())
+
+    def test_company_default(self):
+        cr, uid = self.cr, self.uid
+        self.company.vat_on_payment = True
+        self.assertTrue(self.invoice_model._get_vat_on_payment(cr, uid))
+        self.company.vat_on_payment = False
+        self.assertFalse(self.invoice_model._get_vat_on_payment(cr, uid))
+
+    def test_batch_defaults(self):
+        self.company.vat_on_payment = False
+        defaults = self.invoice_model.get_vat_on_payment_defaults(
+            self.cr, self.uid, [self.partner.id, self.other_partner.id],
+            company_id=self.company.id)
+        self.assertEqual(defaults, {
+            self.partner.id: True,
+            self.other_partner.id: False,
+        })
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from openerp.tests.common import TransactionCase
+
+
+class TestMappings(TransactionCase):
+
+    def setUp(self):
+        super(TestMappings, self).setUp()
+        self.company = self.env.ref('base.main_company')
+        self.company.vat_on_payment = True
+
+    def test_config_invalidation(self):
+        company_model = self.registry('res.company')
+        bank_journal = self.env.ref('account.bank_journal')
+        shadow_journal = self.env.ref(
+            'account_vat_on_payment.shadow_bank_journal')
+        config = company_model.get_vat_on_payment_config(
+            self.cr, self.company.id)
+        self.assertEqual(
+            config['journals'][bank_journal.id], shadow_journal.id)
+        bank_journal.vat_on_payment_related_journal_id = False
+        config = company_model.get_vat_on_payment_config(
+            self.cr, self.company.id)
+        self.assertNotIn(bank_journal.id, config['journals'])
+
+    def test_circular_mapping(self):
+        iva = self.env.ref('account.iva')
+        ivas = self.env.ref('account_vat_on_payment.ivas')
+        ivas.vat_on_payment_related_account_id = iva
+        report = self.registry('res.company').check_vat_on_payment_mappings(
+            self.cr, self.uid, [self.company.id])
+        problems = report.get(self.company.id, [])
+        self.assertTrue(
+            [problem for problem in problems
+             if ivas.name in problem and 'circular' in problem])
+
+    def test_unmapped_income_account(self):
+        account = self.env['account.account'].create({
+            'code': 'X7099',
+            'name': 'Unmapped income',
+            'type': 'other',
+            'user_type': self.env.ref('account.data_account_type_income').id,
+            'parent_id': self.env.ref('account.a_sale').parent_id.id,
+            'company_id': self.company.id,
+        })
+        report = self.registry('res.company').check_vat_on_payment_mappings(
+            self.cr, self.uid, [self.company.id])
+        self.assertTrue(
+            [problem for problem in report.get(self.company.id, [])
+             if account.code in problem])
+        account.vat_on_payment_related_account_id = self.env.ref(
+            'account_vat_on_payment.pss')
+        report = self.registry('res.company').check_vat_on_payment_mappings(
+            self.cr, self.uid, [self.company.id])
+        self.assertFalse(
+            [problem for problem in report.get(self.company.id, [])
+             if account.code in problem])
+
+    def test_set_shadow_account_without_company(self):
+        a_sale = self.env.ref('account.a_sale')
+        line_tuple = self.registry(
+            'account.invoice')._set_vat_on_payment_account(
+                self.cr, self.uid, (0, 0, {'account_id': a_sale.id}))
+        self.assertEqual(line_tuple[2]['real_account_id'], a_sale.id)
+        self.assertEqual(
+            line_tuple[2]['account_id'],
+            a_sale.vat_on_payment_related_account_id.id)
+
+    def test_unmapped_asset_account(self):
+        # fixed assets never appear on invoice lines
+        account = self.env['account.account'].create({
+            'code': 'X2099',
+            'name': 'Unmapped asset',
+            'type': 'other',
+            'user_type': self.env.ref('account.data_account_type_asset').id,
+            'parent_id': self.env.ref('account.a_sale').parent_id.id,
+            'company_id': self.company.id,
+        })
+        report = self.registry('res.company').check_vat_on_payment_mappings(
+            self.cr, self.uid, [self.company.id])
+        self.assertFalse(
+            [problem for problem in report.get(self.company.id, [])
+             if account.code in problem])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+import re
+
+import mock
+
+from .common import VatOnPaymentCase
+
+MOVE_LINE_UPDATE = re.compile(
+    r'^\s*update\s+"?account_move_line"?\s', re.IGNORECASE)
+
+
+class TestMovePaymentLines(VatOnPaymentCase):
+
+    def _relocate_payment_lines(self, invoice_count):
+        """Post a receipt paying invoice_count invoices, then move its
+        payment lines to a new shadow entry.
+        Return the voucher and the UPDATE queries on move lines"""
+        cr, uid = self.cr, self.uid
+        for i in range(invoice_count):
+            self.create_invoice(100.0)
+        voucher_id = self.create_receipt(100.0 * invoice_count)
+        self.voucher_model.action_move_line_create(cr, uid, [voucher_id])
+        voucher = self.voucher_model.browse(cr, uid, voucher_id)
+        shadow_move_id = self.registry('account.move').create(cr, uid, {
+            'journal_id': self.env.ref(
+                'account_vat_on_payment.shadow_bank_journal').id,
+            'period_id': voucher.move_id.period_id.id,
+            'date': voucher.move_id.date,
+        })
+        queries = []
+        execute = cr.execute
+
+        def logged_execute(query, *args, **kwargs):
+            queries.append(query)
+            return execute(query, *args, **kwargs)
+
+        with mock.patch.object(cr, 'execute', side_effect=logged_execute):
+            self.voucher_model._move_payment_lines_to_shadow_entry(
+                cr, uid, voucher, shadow_move_id)
+        updates = [query for query in queries if MOVE_LINE_UPDATE.match(query)]
+        return voucher, updates
+
+    def test_relocation_queries(self):
+        voucher, updates = self._relocate_payment_lines(1)
+        many_voucher, many_updates = self._relocate_payment_lines(3)
+        # one UPDATE for the lines moved to the shadow entry, one for the
+        # real payment entry, whatever the number of invoices
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(len(many_updates), 2)
+
+    def test_relocation_cache(self):
+        voucher, updates = self._relocate_payment_lines(3)
+        # only the bank line is left on the real entry
+        self.assertEqual(len(voucher.move_ids), 1)
+        self.assertEqual(voucher.move_ids[0].account_id.type, 'liquidity')
+        self.assertEqual(len(voucher.move_id.line_id), 1)
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from .common import VatOnPaymentCase
+
+
+class TestPaymentMoves(VatOnPaymentCase):
+
+    def _explain(self, query, params):
+        self.cr.execute('SET LOCAL enable_seqscan = off')
+        self.cr.execute('EXPLAIN ' + query, params)
+        return '\n'.join(row[0] for row in self.cr.fetchall())
+
+    def test_indexes(self):
+        for column in (
+                'real_payment_move_id', 'real_account_id',
+                'real_tax_code_id'):
+            plan = self._explain(
+                'SELECT id FROM account_move_line WHERE %s = %%s' % column,
+                (1, ))
+            self.assertIn('account_move_line_%s_index' % column, plan)
+
+    def test_invoice_payment_moves(self):
+        cr, uid = self.cr, self.uid
+        invoice_id = self.create_invoice(100.0, vat_on_payment=True)
+        voucher_id = self.create_receipt(100.0)
+        self.voucher_model.signal_workflow(
+            cr, uid, [voucher_id], 'proforma_voucher')
+        voucher = self.voucher_model.browse(cr, uid, voucher_id)
+        invoice = self.invoice_model.browse(cr, uid, invoice_id)
+        self.assertEqual(invoice.real_payment_move_ids, voucher.move_id)
+        self.assertEqual(
+            invoice.shadow_payment_move_ids, voucher.shadow_move_id)
+
+    def test_payment_moves_no_invoice(self):
+        self.assertEqual(self.invoice_model._get_payment_moves(
+            self.cr, self.uid, [], None, None), {})
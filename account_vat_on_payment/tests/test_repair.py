@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from .common import VatOnPaymentCase
+
+
+class TestRepair(VatOnPaymentCase):
+
+    def setUp(self):
+        super(TestRepair, self).setUp()
+        cr, uid = self.cr, self.uid
+        tax_id = self.create_tax(0.2)
+        self.create_invoice(100.0, vat_on_payment=True, tax_ids=[tax_id])
+        self.voucher_id = self.create_receipt(120.0)
+        self.voucher_model.signal_workflow(
+            cr, uid, [self.voucher_id], 'proforma_voucher')
+
+    def test_in_sync(self):
+        res = self.voucher_model.repair_vat_on_payment_moves(
+            self.cr, self.uid, [self.voucher_id])
+        self.assertEqual(res, {})
+
+    def test_repair(self):
+        cr, uid = self.cr, self.uid
+        voucher = self.voucher_model.browse(cr, uid, self.voucher_id)
+        vat_line = [
+            line for line in voucher.move_id.line_id
+            if line.account_id == self.env.ref('account.iva')][0]
+        cr.execute(
+            "UPDATE account_move_line SET credit = credit + 5 WHERE id = %s",
+            (vat_line.id, ))
+        self.voucher_model.invalidate_cache(cr, uid)
+
+        res = self.voucher_model.repair_vat_on_payment_moves(
+            cr, uid, [self.voucher_id])
+        self.assertEqual(list(res), [self.voucher_id])
+        # dry run: nothing changed
+        res = self.voucher_model.repair_vat_on_payment_moves(
+            cr, uid, [self.voucher_id], batch_size=1)
+        self.assertEqual(list(res), [self.voucher_id])
+
+        self.voucher_model.repair_vat_on_payment_moves(
+            cr, uid, [self.voucher_id], dry_run=False)
+        res = self.voucher_model.repair_vat_on_payment_moves(
+            cr, uid, [self.voucher_id])
+        self.assertEqual(res, {})
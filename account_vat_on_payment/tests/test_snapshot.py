@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from .common import VatOnPaymentCase
+
+
+class TestSnapshot(VatOnPaymentCase):
+
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+        self.snapshot_model = self.registry(
+            'account.vat.on.payment.snapshot')
+        self.tax = self.registry('account.tax').browse(
+            self.cr, self.uid, self.create_tax(0.2))
+
+    def _balances(self):
+        """{tax code: (shadow balance, real balance)} over every period"""
+        res = {}
+        snapshot_ids = self.snapshot_model.search(
+            self.cr, self.uid, [('tax_code_id', 'in', [
+                self.tax.tax_code_id.id,
+                self.tax.tax_code_id.vat_on_payment_related_tax_code_id.id,
+            ])])
+        for snapshot in self.snapshot_model.browse(
+                self.cr, self.uid, snapshot_ids):
+            shadow, real = res.get(snapshot.tax_code_id.id, (0.0, 0.0))
+            res[snapshot.tax_code_id.id] = (
+                shadow + snapshot.shadow_balance,
+                real + snapshot.real_balance)
+        return res
+
+    def test_invoice_and_payment(self):
+        cr, uid = self.cr, self.uid
+        tax_code_id = self.tax.tax_code_id.id
+        shadow_tax_code_id = \
+            self.tax.tax_code_id.vat_on_payment_related_tax_code_id.id
+        self.create_invoice(100.0, vat_on_payment=True, tax_ids=[self.tax.id])
+        self.assertEqual(self._balances()[shadow_tax_code_id], (20.0, 0.0))
+
+        voucher_id = self.create_receipt(120.0)
+        self.voucher_model.signal_workflow(
+            cr, uid, [voucher_id], 'proforma_voucher')
+        balances = self._balances()
+        self.assertEqual(balances[shadow_tax_code_id], (0.0, 0.0))
+        self.assertEqual(balances[tax_code_id], (0.0, 20.0))
+
+        self.snapshot_model.rebuild_snapshots(cr, uid)
+        self.assertEqual(self._balances(), balances)
+
+        self.voucher_model.cancel_voucher(cr, uid, [voucher_id])
+        balances = self._balances()
+        self.assertEqual(balances[shadow_tax_code_id], (20.0, 0.0))
+        self.assertEqual(balances[tax_code_id], (0.0, 0.0))
+
+    def test_compact(self):
+        cr, uid = self.cr, self.uid
+        shadow_tax_code_id = \
+            self.tax.tax_code_id.vat_on_payment_related_tax_code_id.id
+        self.create_invoice(100.0, vat_on_payment=True, tax_ids=[self.tax.id])
+        self.create_invoice(50.0, vat_on_payment=True, tax_ids=[self.tax.id])
+        domain = [('tax_code_id', '=', shadow_tax_code_id)]
+        self.assertEqual(
+            len(self.snapshot_model.search(cr, uid, domain)), 2)
+        balances = self._balances()
+        self.assertEqual(balances[shadow_tax_code_id], (30.0, 0.0))
+
+        self.snapshot_model.compact_snapshots(cr, uid)
+        self.assertEqual(
+            len(self.snapshot_model.search(cr, uid, domain)), 1)
+        self.assertEqual(self._balances(), balances)
+
+    def test_cancel_no_voucher(self):
+        self.assertTrue(
+            self.voucher_model.cancel_voucher(self.cr, self.uid, []))
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+import mock
+
+from openerp.tests.common import TransactionCase
+
+from .common import VatOnPaymentCase
+
+
+class TestSplitLineAmounts(TransactionCase):
+
+    def setUp(self):
+        super(TestSplitLineAmounts, self).setUp()
+        self.voucher_model = self.registry('account.voucher')
+        self.currency = self.env.ref('base.main_company').currency_id
+
+    def _split(self, ratio, amounts):
+        return self.voucher_model._split_line_amounts(
+            self.cr, self.uid, ratio, amounts, self.currency)
+
+    def test_exact_sum(self):
+        parts = self._split(1 / 3.0, [100.0, 10.0, 10.0])
+        self.assertEqual(parts, [33.34, 3.33, 3.33])
+        self.assertAlmostEqual(sum(parts), 40.0)
+
+    def test_both_sides(self):
+        self.assertEqual(self._split(0.5, [100.0, -10.0]), [50.0, -5.0])
+
+    def test_nothing_allocated(self):
+        self.assertEqual(self._split(0.0, [100.0, 20.0]), [0.0, 0.0])
+
+
+class TestLineAmountHooks(VatOnPaymentCase):
+
+    def test_hooks_are_called(self):
+        cr, uid = self.cr, self.uid
+        self.create_invoice(100.0, vat_on_payment=True)
+        voucher_id = self.create_receipt(50.0)
+        self.voucher_model.action_move_line_create(cr, uid, [voucher_id])
+        voucher = self.voucher_model.browse(cr, uid, voucher_id)
+        real_lines, shadow_lines = \
+            self.voucher_model._get_vat_on_payment_lines(cr, uid, voucher)
+        self.assertEqual(
+            [vals['credit'] for vals in real_lines], [50.0])
+        # an override of the per line hook is taken into account
+        with mock.patch.object(
+                type(self.voucher_model), '_compute_new_line_amount',
+                return_value=1.0):
+            real_lines, shadow_lines = \
+                self.voucher_model._get_vat_on_payment_lines(
+                    cr, uid, voucher)
+        self.assertEqual(
+            [vals['credit'] for vals in real_lines], [1.0])
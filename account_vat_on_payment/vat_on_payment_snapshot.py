@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2011-2012 Domsense s.r.l. (<http://www.domsense.com>).
+#    Copyright (C) 2014 Agile Business Group sagl (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+
+from openerp.osv import orm, fields
+import openerp.addons.decimal_precision as dp
+from openerp.tools.translate import _
+
+# Tax amounts of the given entries, by period and tax code. Lines on a
+# shadow tax code (target of a mapping) make the shadow balance, lines on a
+# real tax code (source of a mapping) make the real balance
+SNAPSHOT_DELTA_QUERY = """
+    SELECT l.period_id, l.tax_code_id, tc.company_id,
+        SUM(CASE WHEN shadow.id IS NOT NULL
+            THEN l.tax_amount ELSE 0.0 END) AS shadow_balance,
+        SUM(CASE WHEN tc.vat_on_payment_related_tax_code_id IS NOT NULL
+            THEN l.tax_amount ELSE 0.0 END) AS real_balance
+    FROM account_move_line l
+    JOIN account_tax_code tc ON tc.id = l.tax_code_id
+    LEFT JOIN (
+        SELECT DISTINCT vat_on_payment_related_tax_code_id AS id
+        FROM account_tax_code
+        WHERE vat_on_payment_related_tax_code_id IS NOT NULL
+    ) shadow ON shadow.id = l.tax_code_id
+    WHERE l.move_id IN %s
+        AND (shadow.id IS NOT NULL
+             OR tc.vat_on_payment_related_tax_code_id IS NOT NULL)
+    GROUP BY l.period_id, l.tax_code_id, tc.company_id
+    """
+
+# Entries making the 'VAT on payment' ledger: invoices and both entries of
+# the payments
+VAT_ON_PAYMENT_MOVES_QUERY = """
+    SELECT move_id FROM account_invoice
+    WHERE vat_on_payment AND move_id IS NOT NULL
+    UNION
+    SELECT move_id FROM account_voucher
+    WHERE shadow_move_id IS NOT NULL AND move_id IS NOT NULL
+    UNION
+    SELECT shadow_move_id FROM account_voucher
+    WHERE shadow_move_id IS NOT NULL
+    """
+
+
+class VatOnPaymentSnapshot(orm.Model):
+    """
+    Balances of shadow and real tax codes by period, for the 'VAT on
+    payment' invoices and payments. Rows are only appended when invoices are
+    validated or cancelled and when vouchers are posted or cancelled, so
+    that VAT returns don't have to sum the whole history of move lines,
+    and concurrent postings never wait on the same row. A (period, tax code)
+    balance is the sum of its rows, which compact_snapshots merges
+    """
+    _name = 'account.vat.on.payment.snapshot'
+    _description = 'VAT on payment balances by period'
+    _log_access = False
+    _order = 'period_id desc, tax_code_id'
+    _columns = {
+        'company_id': fields.many2one(
+            'res.company', 'Company', required=True, readonly=True,
+            select=True),
+        'period_id': fields.many2one(
+            'account.period', 'Period', required=True, readonly=True,
+            select=True),
+        'tax_code_id': fields.many2one(
+            'account.tax.code', 'Tax code', required=True, readonly=True),
+        'shadow_balance': fields.float(
+            'Invoiced, not paid', digits_compute=dp.get_precision('Account'),
+            readonly=True),
+        'real_balance': fields.float(
+            'Paid', digits_compute=dp.get_precision('Account'),
+            readonly=True),
+    }
+
+    def update_snapshots(self, cr, uid, move_ids, sign=1, context=None):
+        """
+        Add (sign=1) or remove (sign=-1) the tax amounts of the given
+        entries to the snapshots, as new rows
+        """
+        if not move_ids:
+            return True
+        cr.execute("""
+            INSERT INTO account_vat_on_payment_snapshot
+            (period_id, tax_code_id, company_id, shadow_balance,
+             real_balance)
+            SELECT period_id, tax_code_id, company_id,
+                %s * shadow_balance, %s * real_balance
+            FROM (""" + SNAPSHOT_DELTA_QUERY + """) delta
+            """, (sign, sign, tuple(move_ids)))
+        self.invalidate_cache(cr, uid, context=context)
+        return True
+
+    def compact_snapshots(self, cr, uid, context=None):
+        """
+        Merge the rows of each period and tax code into one. Only the rows
+        visible to this transaction are deleted, so rows appended meanwhile
+        by other transactions are kept as they are
+        """
+        cr.execute("""
+            WITH old AS (
+                DELETE FROM account_vat_on_payment_snapshot
+                RETURNING company_id, period_id, tax_code_id,
+                    shadow_balance, real_balance
+            )
+            INSERT INTO account_vat_on_payment_snapshot
+            (company_id, period_id, tax_code_id, shadow_balance,
+             real_balance)
+            SELECT company_id, period_id, tax_code_id,
+                SUM(shadow_balance), SUM(real_balance)
+            FROM old
+            GROUP BY company_id, period_id, tax_code_id
+            """)
+        self.invalidate_cache(cr, uid, context=context)
+        return True
+
+    def rebuild_snapshots(self, cr, uid, context=None):
+        """Compute every snapshot again from the move lines"""
+        cr.execute("DELETE FROM account_vat_on_payment_snapshot")
+        cr.execute(VAT_ON_PAYMENT_MOVES_QUERY)
+        move_ids = [row[0] for row in cr.fetchall()]
+        if move_ids:
+            cr.execute("""
+                INSERT INTO account_vat_on_payment_snapshot
+                (period_id, tax_code_id, company_id, shadow_balance,
+                 real_balance)
+                """ + SNAPSHOT_DELTA_QUERY, (tuple(move_ids), ))
+        self.invalidate_cache(cr, uid, context=context)
+        return True
+
+    def _get_move_line_ids(self, cr, uid, snapshot, context=None):
+        cr.execute("""
+            SELECT id FROM account_move_line
+            WHERE period_id = %s AND tax_code_id = %s
+                AND move_id IN (""" + VAT_ON_PAYMENT_MOVES_QUERY + """)
+            """, (snapshot.period_id.id, snapshot.tax_code_id.id))
+        return [row[0] for row in cr.fetchall()]
+
+    def action_open_move_lines(self, cr, uid, ids, context=None):
+        snapshot = self.browse(cr, uid, ids[0], context=context)
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('%s - %s') % (
+                snapshot.period_id.name, snapshot.tax_code_id.name),
+            'res_model': 'account.move.line',
+            'view_type': 'form',
+            'view_mode': 'tree,form',
+            'domain': [('id', 'in', self._get_move_line_ids(
+                cr, uid, snapshot, context=context))],
+            'context': context,
+        }
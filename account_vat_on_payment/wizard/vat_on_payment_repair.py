@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2011-2012 Domsense s.r.l. (<http://www.domsense.com>).
+#    Copyright (C) 2014 Agile Business Group sagl (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+
+from openerp.osv import orm, fields
+from openerp.tools.translate import _
+
+
+class VatOnPaymentRepair(orm.TransientModel):
+    _name = 'account.vat.on.payment.repair'
+    _description = 'Check and repair VAT on payment entries'
+    _columns = {
+        'date_from': fields.date('From'),
+        'date_to': fields.date('To'),
+        'journal_ids': fields.many2many(
+            'account.journal', string='Journals',
+            domain=[('type', 'in', ['bank', 'cash'])],
+            help="Leave empty for every payment journal"),
+        'batch_size': fields.integer(
+            'Batch size', required=True,
+            help="Number of vouchers processed at once"),
+        'report': fields.text('Report', readonly=True),
+        'state': fields.selection([
+            ('draft', 'Draft'),
+            ('done', 'Done'),
+        ], 'State', readonly=True),
+    }
+    _defaults = {
+        'batch_size': 100,
+        'state': 'draft',
+    }
+
+    def _get_voucher_ids(self, cr, uid, wizard, context=None):
+        domain = [
+            ('state', '=', 'posted'),
+            ('type', 'in', ['payment', 'receipt']),
+        ]
+        if wizard.date_from:
+            domain.append(('date', '>=', wizard.date_from))
+        if wizard.date_to:
+            domain.append(('date', '<=', wizard.date_to))
+        if wizard.journal_ids:
+            domain.append(
+                ('journal_id', 'in', [j.id for j in wizard.journal_ids]))
+        return self.pool.get('account.voucher').search(
+            cr, uid, domain, order='id', context=context)
+
+    def _run(self, cr, uid, ids, dry_run, context=None):
+        voucher_pool = self.pool.get('account.voucher')
+        wizard = self.browse(cr, uid, ids[0], context=context)
+        voucher_ids = self._get_voucher_ids(cr, uid, wizard, context=context)
+        res = voucher_pool.repair_vat_on_payment_moves(
+            cr, uid, voucher_ids, dry_run=dry_run,
+            batch_size=wizard.batch_size, context=context)
+        report = [
+            dry_run
+            and _('%d vouchers checked, %d out of sync')
+            % (len(voucher_ids), len(res))
+            or _('%d vouchers checked, %d repaired')
+            % (len(voucher_ids), len(res))
+        ]
+        for voucher in voucher_pool.browse(
+                cr, uid, sorted(res), context=context):
+            report.append('')
+            report.append(voucher.number or voucher.name or str(voucher.id))
+            report.extend(res[voucher.id])
+        wizard.write({'report': '\n'.join(report), 'state': 'done'})
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': wizard.id,
+            'view_type': 'form',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': context,
+        }
+
+    def button_check(self, cr, uid, ids, context=None):
+        return self._run(cr, uid, ids, True, context=context)
+
+    def button_repair(self, cr, uid, ids, context=None):
+        return self._run(cr, uid, ids, False, context=context)
@@ -20,5 +20,7 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 ##############################################################################
+from . import account_invoice
 from . import account_voucher
 from . import company
+from .init_hook import pre_init_hook
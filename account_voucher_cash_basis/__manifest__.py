@@ -53,5 +53,6 @@ cash basis.
         'voucher_view.xml',
     ],
     'demo': [],
+    'pre_init_hook': 'pre_init_hook',
     'installable': False,
 }
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2011-2012 Domsense s.r.l. (<http://www.domsense.com>).
+#    Copyright (C) 2012-2014 Agile Business Group sagl
+#    (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+from openerp.osv import fields, orm
+import openerp.addons.decimal_precision as dp
+
+# receivable/payable totals of invoices, in company and invoice currency
+INVOICE_TOTALS_QUERY = """
+    SELECT inv.id,
+        SUM(CASE WHEN COALESCE(aml.debit, 0) <> 0
+            THEN aml.debit ELSE COALESCE(aml.credit, 0) END),
+        SUM(ABS(COALESCE(aml.amount_currency, 0)))
+    FROM account_invoice inv
+    JOIN account_move_line aml ON aml.move_id = inv.move_id
+    JOIN account_account acc ON acc.id = aml.account_id
+    WHERE inv.id IN %s
+    AND acc.type IN ('receivable', 'payable')
+    GROUP BY inv.id
+"""
+
+
+class AccountInvoice(orm.Model):
+    _inherit = "account.invoice"
+
+    def _get_cash_basis_totals(
+        self, cr, uid, ids, field_names, arg, context=None
+    ):
+        res = dict(
+            (inv_id, {
+                'cash_basis_total': 0.0,
+                'cash_basis_total_currency': 0.0,
+            }) for inv_id in ids)
+        if not ids:
+            return res
+        cr.execute(INVOICE_TOTALS_QUERY, (tuple(ids), ))
+        for inv_id, total, total_currency in cr.fetchall():
+            res[inv_id] = {
+                'cash_basis_total': total,
+                'cash_basis_total_currency': total_currency,
+            }
+        return res
+
+    def _get_invoices_from_move_lines(self, cr, uid, ids, context=None):
+        # self is account.move.line
+        cr.execute("""
+            SELECT DISTINCT inv.id
+            FROM account_invoice inv
+            JOIN account_move_line aml ON aml.move_id = inv.move_id
+            WHERE aml.id IN %s
+            """, (tuple(ids), ))
+        return [row[0] for row in cr.fetchall()]
+
+    def _get_invoices_from_self(self, cr, uid, ids, context=None):
+        return ids
+
+    # totals follow the invoice entry, and the amounts and accounts of its
+    # lines. The move line trigger costs one indexed query (line -> entry
+    # -> invoice) for every move line created or written with one of these
+    # fields, invoice or not: lines never change entry once created, apart
+    # from payment lines, so 'move_id' is not followed
+    _columns = {
+        'cash_basis_total': fields.function(
+            _get_cash_basis_totals, type='float', multi='cash_basis_totals',
+            digits_compute=dp.get_precision('Account'),
+            string='Receivable/payable total',
+            store={
+                'account.invoice': (
+                    _get_invoices_from_self, ['move_id'], 20),
+                'account.move.line': (
+                    _get_invoices_from_move_lines,
+                    ['debit', 'credit', 'amount_currency', 'account_id'],
+                    20),
+            }),
+        'cash_basis_total_currency': fields.function(
+            _get_cash_basis_totals, type='float', multi='cash_basis_totals',
+            digits_compute=dp.get_precision('Account'),
+            string='Receivable/payable total in invoice currency',
+            store={
+                'account.invoice': (
+                    _get_invoices_from_self, ['move_id'], 20),
+                'account.move.line': (
+                    _get_invoices_from_move_lines,
+                    ['debit', 'credit', 'amount_currency', 'account_id'],
+                    20),
+            }),
+    }
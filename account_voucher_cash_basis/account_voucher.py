@@ -21,10 +21,17 @@
 #
 ##############################################################################
 
+import logging
+import math
+import time
+
 from openerp.osv import fields, orm
+from openerp.tools import float_round
 from openerp.tools.translate import _
 import openerp.addons.decimal_precision as dp
 
+_logger = logging.getLogger(__name__)
+
 
 class AccountVoucher(orm.Model):
     _inherit = "account.voucher"
@@ -43,45 +50,76 @@ class AccountVoucher(orm.Model):
     }
 
     def balance_move(self, cr, uid, move_id, context=None):
+        return self.balance_moves(cr, uid, [move_id], context=context)[move_id]
+
+    def balance_moves(self, cr, uid, move_ids, context=None):
+        """
+        Fix the rounding difference of several moves at once.
+        Lines of every move are read by one query; for each unbalanced move,
+        the first line that's not receivable, payable or liquidity is
+        adjusted with a single write.
+        Return a dictionary {move_id: rounding difference}
+        """
         currency_obj = self.pool.get('res.currency')
-        move = self.pool.get('account.move').browse(cr, uid, move_id, context)
-        amount = 0.0
-        for line in move.line_id:
-            amount += line.debit - line.credit
-        amount = currency_obj.round(
-            cr, uid, move.company_id.currency_id, amount)
-        # check if balance differs for more than 1 decimal according to account
-        # decimal precision
-        if abs(amount * 10 ** dp.get_precision('Account')(cr)[1]) > 1:
-            raise orm.except_orm(
-                _('Error'),
-                _('The generated payment entry is unbalanced for more than 1 '
-                  'decimal'))
-        if not currency_obj.is_zero(
-            cr, uid, move.company_id.currency_id, amount
-        ):
-            for line in move.line_id:
-                # adjust the first move line that's not receivable, payable or
-                # liquidity
-                if (
-                    line.account_id.type != 'receivable' and
-                    line.account_id.type != 'payable' and
-                    line.account_id.type != 'liquidity'
-                ):
-                    if line.credit:
-                        line.write({
-                            'credit': line.credit + amount,
-                        }, update_check=False)
-                    elif line.debit:
-                        line.write({
-                            'debit': line.debit - amount,
-                        }, update_check=False)
-                    if line.tax_amount:
-                        line.write({
-                            'tax_amount': line.tax_amount + amount,
-                        }, update_check=False)
+        move_line_obj = self.pool.get('account.move.line')
+        res = dict.fromkeys(move_ids, 0.0)
+        if not move_ids:
+            return res
+        # same order as account.move.line, that is the one of move.line_id
+        cr.execute("""
+            SELECT aml.move_id, aml.id, aml.debit, aml.credit,
+                aml.tax_amount, acc.type, comp.currency_id
+            FROM account_move_line aml
+            JOIN account_account acc ON acc.id = aml.account_id
+            JOIN account_move am ON am.id = aml.move_id
+            JOIN res_company comp ON comp.id = am.company_id
+            WHERE aml.move_id IN %s
+            ORDER BY aml.date DESC, aml.id DESC
+            """, (tuple(move_ids), ))
+        lines_by_move = {}
+        currency_by_move = {}
+        for row in cr.dictfetchall():
+            lines_by_move.setdefault(row['move_id'], []).append(row)
+            currency_by_move[row['move_id']] = row['currency_id']
+        precision = dp.get_precision('Account')(cr)[1]
+        currencies = {}
+        for move_id, lines in lines_by_move.iteritems():
+            currency_id = currency_by_move[move_id]
+            if currency_id not in currencies:
+                currencies[currency_id] = currency_obj.browse(
+                    cr, uid, currency_id, context=context)
+            currency = currencies[currency_id]
+            amount = currency_obj.round(
+                cr, uid, currency,
+                sum((line['debit'] or 0.0) - (line['credit'] or 0.0)
+                    for line in lines))
+            # check if balance differs for more than 1 decimal according to
+            # account decimal precision
+            if abs(amount * 10 ** precision) > 1:
+                raise orm.except_orm(
+                    _('Error'),
+                    _('The generated payment entry is unbalanced for more '
+                      'than 1 decimal'))
+            res[move_id] = amount
+            if currency_obj.is_zero(cr, uid, currency, amount):
+                continue
+            for line in lines:
+                # adjust the first move line that's not receivable, payable
+                # or liquidity
+                if line['type'] not in ('receivable', 'payable', 'liquidity'):
+                    vals = {}
+                    if line['credit']:
+                        vals['credit'] = line['credit'] + amount
+                    elif line['debit']:
+                        vals['debit'] = line['debit'] - amount
+                    if line['tax_amount']:
+                        vals['tax_amount'] = line['tax_amount'] + amount
+                    if vals:
+                        move_line_obj.write(
+                            cr, uid, [line['id']], vals, context=context,
+                            update_check=False)
                     break
-        return amount
+        return res
 
     def voucher_move_line_create(
         self, cr, uid, voucher_id, line_total,
@@ -90,22 +128,117 @@ class AccountVoucher(orm.Model):
         res = super(AccountVoucher, self).voucher_move_line_create(
             cr, uid, voucher_id, line_total, move_id, company_currency,
             current_currency, context)
-        self.write(cr, uid, voucher_id, {'line_total': res[0]}, context)
+        line_totals = (context or {}).get('cash_basis_line_totals')
+        if line_totals is not None:
+            # batch posting: every line_total is stored at the end, see
+            # action_move_line_create_batch
+            line_totals[voucher_id] = res[0]
+        else:
+            self.write(cr, uid, voucher_id, {'line_total': res[0]}, context)
         return res
 
+    def _get_line_total(self, cr, uid, voucher, context=None):
+        line_totals = (context or {}).get('cash_basis_line_totals') or {}
+        return line_totals.get(voucher.id, voucher.line_total)
+
+    def _write_line_totals(self, cr, uid, line_totals, context=None):
+        """Store line_total of several vouchers with a single query"""
+        if not line_totals:
+            return True
+        values = []
+        for voucher_id, line_total in line_totals.iteritems():
+            values.extend([voucher_id, line_total])
+        cr.execute("""
+            UPDATE account_voucher v SET line_total = t.line_total
+            FROM (VALUES %s) AS t(id, line_total)
+            WHERE v.id = t.id
+            """ % ', '.join(['(%s, %s)'] * len(line_totals)), values)
+        self.invalidate_cache(
+            cr, uid, ['line_total'], line_totals.keys(), context=context)
+        return True
+
+    def action_move_line_create_batch(self, cr, uid, ids, context=None):
+        """
+        Post several vouchers in one call, for example a lockbox import.
+        Moves are still created and balanced voucher by voucher, by
+        action_move_line_create, exactly as when posting them one by one:
+        only the line_total of every voucher is stored with one query,
+        instead of one write per voucher.
+        The workflow is moved forward afterwards: the second
+        action_move_line_create it runs skips vouchers that already have
+        a move.
+        Return the throughput statistics, also logged
+        """
+        start = time.time()
+        ctx = dict(context or {}, cash_basis_line_totals={})
+        self.action_move_line_create(cr, uid, ids, context=ctx)
+        self._write_line_totals(
+            cr, uid, ctx['cash_basis_line_totals'], context=context)
+        move_ids = [
+            voucher['move_id'][0]
+            for voucher in self.read(
+                cr, uid, ids, ['move_id'], context=context)
+            if voucher['move_id']
+        ]
+        # moves are already there: this only moves the workflow forward
+        self.signal_workflow(
+            cr, uid, ids, 'proforma_voucher', context=context)
+        elapsed = time.time() - start
+        stats = {
+            'vouchers': len(ids),
+            'moves': len(move_ids),
+            'seconds': elapsed,
+            'vouchers_per_second': elapsed and len(ids) / elapsed or 0.0,
+        }
+        _logger.info(
+            "Posted %(vouchers)d vouchers in %(seconds).2fs "
+            "(%(vouchers_per_second).1f vouchers/s)", stats)
+        return stats
+
     def get_invoice_total(self, invoice):
-        res = 0.0
-        for inv_move_line in invoice.move_id.line_id:
-            if inv_move_line.account_id.type in ('receivable', 'payable'):
-                res += inv_move_line.debit or inv_move_line.credit
-        return res
+        return invoice.cash_basis_total
 
     def get_invoice_total_currency(self, invoice):
-        res = 0.0
-        for inv_move_line in invoice.move_id.line_id:
-            if inv_move_line.account_id.type in ('receivable', 'payable'):
-                res += abs(inv_move_line.amount_currency)
-        return res
+        return invoice.cash_basis_total_currency
+
+    def _convert_amounts(self, cr, uid, amounts, voucher_id, context=None):
+        """
+        Batch version of _convert_amount: convert every amount of the list
+        from voucher currency to company currency.
+        The conversion rate is read once for the call, with the context
+        given (date, and the voucher special rate set by account_voucher),
+        so it's not kept from one voucher to another
+        """
+        currency_obj = self.pool.get('res.currency')
+        voucher = self.browse(cr, uid, voucher_id, context=context)
+        from_currency = voucher.currency_id
+        to_currency = voucher.company_id.currency_id
+        if from_currency.id == to_currency.id:
+            rate = 1.0
+        else:
+            rate = currency_obj._get_conversion_rate(
+                cr, uid, from_currency, to_currency, context=context)
+        rounding = to_currency.rounding
+        return [
+            float_round(amount * rate, precision_rounding=rounding)
+            for amount in amounts
+        ]
+
+    def get_invoices_totals(self, cr, uid, invoice_ids, context=None):
+        """
+        Return the receivable/payable totals of the given invoices, in
+        company and in invoice currency, as a dictionary
+        {invoice_id: (total, total_currency)}, as given by get_invoice_total
+        and get_invoice_total_currency.
+        Totals are stored on invoices, so they are read for every invoice
+        at once
+        """
+        return dict(
+            (invoice.id, (
+                self.get_invoice_total(invoice),
+                self.get_invoice_total_currency(invoice)))
+            for invoice in self.pool.get('account.invoice').browse(
+                cr, uid, invoice_ids, context=context))
 
     def allocated_amounts_grouped_by_invoice(
         self, cr, uid, voucher, context=None
@@ -140,69 +273,148 @@ class AccountVoucher(orm.Model):
         In order to compute cashed amount correctly, write-off will be
         subtract to reconciled amount.
         If more than one invoice is paid with this voucher, we distribute
-        write-off equally (if allowed)
+        write-off (if allowed) according to company 'write_off_distribution':
+        equally, proportionally to invoices residual or to allocated
+        amounts. Parts are rounded so that their sum is exactly the
+        write-off
 
         '''
         res = {}
+        currency_obj = self.pool.get('res.currency')
         ctx = dict(context) or {}
         company_currency = super(AccountVoucher, self)._get_company_currency(
             cr, uid, voucher.id, context=ctx)
         current_currency = super(AccountVoucher, self)._get_current_currency(
             cr, uid, voucher.id, context=ctx)
-        for line in voucher.line_ids:
-            if line.amount and line.move_line_id and line.move_line_id.invoice:
-                if line.move_line_id.invoice.id not in res:
-                    res[line.move_line_id.invoice.id] = {
-                        'allocated': 0.0,
-                        'total': 0.0,
-                        'total_currency': 0.0,
-                        'write-off': 0.0,
-                        'allocated_currency': 0.0,
-                        'foreign_currency_id': False,
-                        'currency-write-off': 0.0,
-                    }
-                current_amount = line.amount
-                if company_currency != current_currency:
-                    ctx['date'] = voucher.date
-                    current_amount = super(
-                        AccountVoucher, self)._convert_amount(
-                            cr, uid, line.amount, voucher.id, context=ctx)
-                    res[line.move_line_id.invoice.id][
-                        'allocated_currency'
-                    ] += line.amount
-                    res[line.move_line_id.invoice.id][
-                        'foreign_currency_id'
-                    ] = current_currency
-                    res[line.move_line_id.invoice.id][
-                        'total_currency'
-                    ] = self.get_invoice_total_currency(
-                        line.move_line_id.invoice)
+        lines = [
+            line for line in voucher.line_ids
+            if line.amount and line.move_line_id and line.move_line_id.invoice
+        ]
+        current_amounts = [line.amount for line in lines]
+        if company_currency != current_currency:
+            # every line shares the voucher date: convert them in one pass
+            ctx['date'] = voucher.date
+            current_amounts = self._convert_amounts(
+                cr, uid, current_amounts, voucher.id, context=ctx)
+        for line, current_amount in zip(lines, current_amounts):
+            if line.move_line_id.invoice.id not in res:
+                res[line.move_line_id.invoice.id] = {
+                    'allocated': 0.0,
+                    'total': 0.0,
+                    'total_currency': 0.0,
+                    'write-off': 0.0,
+                    'allocated_currency': 0.0,
+                    'foreign_currency_id': False,
+                    'currency-write-off': 0.0,
+                }
+            if company_currency != current_currency:
                 res[line.move_line_id.invoice.id][
-                    'allocated'
-                ] += current_amount
+                    'allocated_currency'
+                ] += line.amount
                 res[line.move_line_id.invoice.id][
-                    'total'
-                ] = self.get_invoice_total(line.move_line_id.invoice)
+                    'foreign_currency_id'
+                ] = current_currency
+            res[line.move_line_id.invoice.id][
+                'allocated'
+            ] += current_amount
+        # invoice totals are computed once for every invoice, instead of
+        # once per voucher line
+        totals = self.get_invoices_totals(
+            cr, uid, res.keys(), context=context)
+        for inv_id in res:
+            res[inv_id]['total'] = totals[inv_id][0]
+            if company_currency != current_currency:
+                res[inv_id]['total_currency'] = totals[inv_id][1]
         if res:
             # we use line_total as it can be != writeoff_amount in case of
             # multi currency
-            write_off_per_invoice = voucher.line_total / len(res)
+            line_total = self._get_line_total(
+                cr, uid, voucher, context=context)
             if not voucher.company_id.allow_distributing_write_off and len(
                 res
-            ) > 1 and write_off_per_invoice:
+            ) > 1 and line_total:
                 raise orm.except_orm(_('Error'), _(
                     'You are trying to pay with write-off more than one '
                     'invoice and distributing write-off is not allowed. '
                     'See company settings.'))
+            sign = 1
             if voucher.type == 'payment' or voucher.type == 'purchase':
-                write_off_per_invoice = - write_off_per_invoice
-            for inv_id in res:
-                res[inv_id]['write-off'] = write_off_per_invoice
+                sign = -1
+            invoice_ids = sorted(res)
+            weights = self._get_write_off_weights(
+                cr, uid, voucher, res, lines, context=context)
+            write_offs = self._split_amount(
+                cr, uid, sign * line_total, weights,
+                currency_obj.browse(cr, uid, company_currency, context=ctx),
+                context=context)
+            for inv_id, write_off in zip(invoice_ids, write_offs):
+                res[inv_id]['write-off'] = write_off
             if company_currency != current_currency:
-                curr_write_off_per_invoice = voucher.writeoff_amount / len(res)
-                if voucher.type == 'payment' or voucher.type == 'purchase':
-                    curr_write_off_per_invoice = - curr_write_off_per_invoice
-                for inv_id in res:
-                    res[inv_id][
-                        'currency-write-off'] = curr_write_off_per_invoice
+                curr_write_offs = self._split_amount(
+                    cr, uid, sign * voucher.writeoff_amount, weights,
+                    currency_obj.browse(
+                        cr, uid, current_currency, context=ctx),
+                    context=context)
+                for inv_id, curr_write_off in zip(
+                    invoice_ids, curr_write_offs
+                ):
+                    res[inv_id]['currency-write-off'] = curr_write_off
         return res
+
+    def _get_write_off_weights(
+        self, cr, uid, voucher, amounts_by_invoice, lines, context=None
+    ):
+        """
+        Return the weights used to distribute write-off over the invoices
+        of amounts_by_invoice, following the order of their ids.
+        'lines' are the voucher lines allocated to those invoices.
+        Override this to add a distribution method to company settings
+        """
+        invoice_ids = sorted(amounts_by_invoice)
+        method = voucher.company_id.write_off_distribution
+        if method == 'residual':
+            residuals = dict.fromkeys(invoice_ids, 0.0)
+            for line in lines:
+                residuals[line.move_line_id.invoice.id] += abs(
+                    line.amount_unreconciled)
+            return [residuals[inv_id] for inv_id in invoice_ids]
+        if method == 'allocated':
+            return [
+                abs(amounts_by_invoice[inv_id]['allocated'])
+                for inv_id in invoice_ids
+            ]
+        return [1.0] * len(invoice_ids)
+
+    def _split_amount(
+        self, cr, uid, amount, weights, currency, context=None
+    ):
+        """
+        Split amount proportionally to weights, rounded according to
+        currency. Largest remainder method is used, so that the sum of the
+        parts is exactly the rounded amount.
+        If every weight is 0, amount is split equally
+        """
+        if not weights:
+            return []
+        rounding = currency.rounding
+        total_units = int(round(amount / rounding))
+        sign = total_units < 0 and -1 or 1
+        total_units = abs(total_units)
+        weights = [abs(weight) for weight in weights]
+        total_weight = float(sum(weights))
+        if not total_weight:
+            weights = [1.0] * len(weights)
+            total_weight = float(len(weights))
+        shares = [total_units * weight / total_weight for weight in weights]
+        units = [int(math.floor(share)) for share in shares]
+        remainder = total_units - sum(units)
+        # give the units left to the largest fractional parts (the first
+        # ones, for equal parts)
+        by_fraction = sorted(
+            range(len(shares)), key=lambda index: units[index] - shares[index])
+        for index in by_fraction[:remainder]:
+            units[index] += 1
+        return [
+            float_round(sign * unit * rounding, precision_rounding=rounding)
+            for unit in units
+        ]
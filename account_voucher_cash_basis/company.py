@@ -24,6 +24,13 @@
 from openerp.osv import fields, orm
 
 
+WRITE_OFF_DISTRIBUTION_SELECTION = [
+    ('equal', 'Equally'),
+    ('residual', 'Proportionally to residual amounts'),
+    ('allocated', 'Proportionally to allocated amounts'),
+]
+
+
 class ResCompany(orm.Model):
     _inherit = "res.company"
     _columns = {
@@ -31,7 +38,16 @@ class ResCompany(orm.Model):
             'Allow distributing write-off',
             help="If not set, paying several 'cash basis' invoices with same "
                  "voucher with write-off won't be allowed. If set, write-off "
-                 "will be distributed equally over invoices"),
+                 "will be distributed over invoices according to "
+                 "'Write-off distribution'"),
+        'write_off_distribution': fields.selection(
+            WRITE_OFF_DISTRIBUTION_SELECTION, 'Write-off distribution',
+            required=True,
+            help="How write-off is distributed over the invoices paid by "
+                 "the same voucher"),
+    }
+    _defaults = {
+        'write_off_distribution': 'equal',
     }
 
 
@@ -44,7 +60,15 @@ class AccountConfigSettings(orm.TransientModel):
             string="Allow distributing write-off",
             help="If not set, paying several 'cash basis' invoices with same "
                  "voucher with write-off won't be allowed. If set, write-off "
-                 "will be distributed equally over invoices"),
+                 "will be distributed over invoices according to "
+                 "'Write-off distribution'"),
+        'write_off_distribution': fields.related(
+            'company_id', 'write_off_distribution',
+            type="selection",
+            selection=WRITE_OFF_DISTRIBUTION_SELECTION,
+            string="Write-off distribution",
+            help="How write-off is distributed over the invoices paid by "
+                 "the same voucher"),
     }
 
     def onchange_company_id(self, cr, uid, ids, company_id, context=None):
@@ -56,9 +80,11 @@ class AccountConfigSettings(orm.TransientModel):
             res['value'].update({
                 'allow_distributing_write_off': (
                     company.allow_distributing_write_off),
+                'write_off_distribution': company.write_off_distribution,
             })
         else:
             res['value'].update({
                 'allow_distributing_write_off': False,
+                'write_off_distribution': 'equal',
             })
         return res
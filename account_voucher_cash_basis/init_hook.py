@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    OpenERP, Open Source Management Solution
+#    Copyright (C) 2011-2012 Domsense s.r.l. (<http://www.domsense.com>).
+#    Copyright (C) 2012-2014 Agile Business Group sagl
+#    (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import logging
+
+from .account_invoice import INVOICE_TOTALS_QUERY
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+
+
+def pre_init_hook(cr):
+    """
+    Compute the stored receivable/payable totals of existing invoices by
+    chunks of invoices, instead of letting the ORM compute them for the
+    whole invoice table at install time
+    """
+    store_field_cash_basis_totals(cr)
+
+
+def store_field_cash_basis_totals(cr):
+
+    for column_name, comment in (
+        ('cash_basis_total', 'Receivable/payable total'),
+        ('cash_basis_total_currency',
+         'Receivable/payable total in invoice currency'),
+    ):
+        cr.execute("""SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name='account_invoice' AND
+        column_name=%s""", (column_name, ))
+        if not cr.fetchone():
+            cr.execute(
+                """
+                ALTER TABLE account_invoice ADD COLUMN %s numeric
+                DEFAULT 0;
+                ALTER TABLE account_invoice ALTER COLUMN %s DROP DEFAULT;
+                COMMENT ON COLUMN account_invoice.%s IS %%s;
+                """ % (column_name, column_name, column_name), (comment, ))
+
+    logger.info(
+        'Computing fields cash_basis_total and cash_basis_total_currency '
+        'on account.invoice')
+
+    cr.execute(
+        "SELECT id FROM account_invoice WHERE move_id IS NOT NULL ORDER BY id")
+    invoice_ids = [row[0] for row in cr.fetchall()]
+    for index in range(0, len(invoice_ids), CHUNK_SIZE):
+        chunk = invoice_ids[index:index + CHUNK_SIZE]
+        cr.execute(
+            """
+            UPDATE account_invoice inv
+            SET cash_basis_total = totals.total,
+                cash_basis_total_currency = totals.total_currency
+            FROM (%s) AS totals(id, total, total_currency)
+            WHERE inv.id = totals.id
+            """ % INVOICE_TOTALS_QUERY, (tuple(chunk), ))
+        logger.info(
+            '%d/%d invoices computed',
+            min(index + CHUNK_SIZE, len(invoice_ids)), len(invoice_ids))
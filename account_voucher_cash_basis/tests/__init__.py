@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from . import test_convert_amounts
+from . import test_invoice_totals
+from . import test_post_batch
+from . import test_split_amount
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+import random
+
+from openerp.tests.common import TransactionCase
+
+
+class TestConvertAmounts(TransactionCase):
+
+    def setUp(self):
+        super(TestConvertAmounts, self).setUp()
+        self.voucher_model = self.registry('account.voucher')
+        journal = self.env.ref('account.bank_journal_usd')
+        self.voucher_id = self.voucher_model.create(self.cr, self.uid, {
+            'type': 'receipt',
+            'partner_id': self.env.ref('base.res_partner_3').id,
+            'journal_id': journal.id,
+            'account_id': journal.default_debit_account_id.id,
+            'amount': 0.0,
+            })
+
+    def test_convert_amounts_as_per_line(self):
+        cr, uid = self.cr, self.uid
+        voucher = self.voucher_model.browse(cr, uid, self.voucher_id)
+        self.assertNotEqual(
+            voucher.currency_id, voucher.company_id.currency_id)
+        ctx = {'date': voucher.date}
+        rnd = random.Random(42)
+        amounts = [round(rnd.uniform(0, 100000), 2) for i in range(3000)]
+        batch = self.voucher_model._convert_amounts(
+            cr, uid, amounts, self.voucher_id, context=ctx)
+        per_line = [
+            self.voucher_model._convert_amount(
+                cr, uid, amount, self.voucher_id, context=ctx)
+            for amount in amounts
+        ]
+        self.assertEqual(batch, per_line)
+
+    def test_convert_amounts_special_rate(self):
+        cr, uid = self.cr, self.uid
+        voucher = self.voucher_model.browse(cr, uid, self.voucher_id)
+        amounts = [10.0, 33.33, 1234.56]
+        ctx = {'date': voucher.date}
+        special_ctx = dict(
+            ctx, voucher_special_currency=voucher.currency_id.id,
+            voucher_special_currency_rate=2.0)
+        for context in (ctx, special_ctx, ctx):
+            batch = self.voucher_model._convert_amounts(
+                cr, uid, amounts, self.voucher_id, context=context)
+            per_line = [
+                self.voucher_model._convert_amount(
+                    cr, uid, amount, self.voucher_id, context=context)
+                for amount in amounts
+            ]
+            self.assertEqual(batch, per_line)
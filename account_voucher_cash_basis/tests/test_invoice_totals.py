@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+import mock
+
+from openerp.tests.common import TransactionCase
+
+
+class TestInvoiceTotals(TransactionCase):
+
+    def setUp(self):
+        super(TestInvoiceTotals, self).setUp()
+        self.invoice_model = self.registry('account.invoice')
+        self.voucher_model = self.registry('account.voucher')
+        self.invoice_id = self.invoice_model.create(self.cr, self.uid, {
+            'journal_id': self.env.ref('account.sales_journal').id,
+            'partner_id': self.env.ref('base.res_partner_3').id,
+            'account_id': self.env.ref('account.a_recv').id,
+            'invoice_line': [(0, 0, {
+                'name': 'Service',
+                'quantity': 1,
+                'price_unit': 120.0,
+                'account_id': self.env.ref('account.a_sale').id,
+            })],
+        })
+        self.invoice_model.signal_workflow(
+            self.cr, self.uid, [self.invoice_id], 'invoice_open')
+
+    def test_stored_totals(self):
+        totals = self.voucher_model.get_invoices_totals(
+            self.cr, self.uid, [self.invoice_id])
+        self.assertEqual(totals, {self.invoice_id: (120.0, 0.0)})
+
+    def test_overridden_total(self):
+        with mock.patch.object(
+                type(self.voucher_model), 'get_invoice_total',
+                return_value=100.0):
+            totals = self.voucher_model.get_invoices_totals(
+                self.cr, self.uid, [self.invoice_id])
+        self.assertEqual(totals, {self.invoice_id: (100.0, 0.0)})
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+from openerp.tests.common import TransactionCase
+
+
+class TestPostBatch(TransactionCase):
+
+    def setUp(self):
+        super(TestPostBatch, self).setUp()
+        self.invoice_model = self.registry('account.invoice')
+        self.voucher_model = self.registry('account.voucher')
+        self.bank_journal = self.env.ref('account.bank_journal')
+
+    def create_receipt(self, partner_id, invoice_amount, amount):
+        """Receipt partially paying a new invoice of the partner"""
+        cr, uid = self.cr, self.uid
+        invoice_id = self.invoice_model.create(cr, uid, {
+            'journal_id': self.env.ref('account.sales_journal').id,
+            'partner_id': partner_id,
+            'account_id': self.env.ref('account.a_recv').id,
+            'invoice_line': [(0, 0, {
+                'name': 'Service',
+                'quantity': 3,
+                'price_unit': invoice_amount / 3,
+                'account_id': self.env.ref('account.a_sale').id,
+            })],
+        })
+        self.invoice_model.signal_workflow(
+            cr, uid, [invoice_id], 'invoice_open')
+        ctx = {'type': 'receipt'}
+        res = self.voucher_model.onchange_partner_id(
+            cr, uid, [], partner_id, self.bank_journal.id, amount,
+            self.bank_journal.company_id.currency_id.id, 'receipt', False,
+            context=ctx)
+        return self.voucher_model.create(cr, uid, {
+            'type': 'receipt',
+            'partner_id': partner_id,
+            'journal_id': self.bank_journal.id,
+            'account_id': self.bank_journal.default_debit_account_id.id,
+            'amount': amount,
+            'line_cr_ids': [
+                (0, 0, vals) for vals in res['value']['line_cr_ids']],
+        }, context=ctx)
+
+    def _posting(self, voucher_ids):
+        """line_total and move lines of each voucher"""
+        res = []
+        for voucher in self.voucher_model.browse(
+                self.cr, self.uid, voucher_ids):
+            self.assertEqual(voucher.state, 'posted')
+            res.append((voucher.line_total, sorted(
+                (line.account_id.id, line.debit, line.credit,
+                 line.tax_amount)
+                for line in voucher.move_id.line_id)))
+        return res
+
+    def test_batch_as_one_by_one(self):
+        cr, uid = self.cr, self.uid
+        amounts = [(100.0, 33.33), (200.0, 66.67), (10.0, 3.33)]
+        partners = [
+            self.env.ref('base.res_partner_%d' % i).id for i in range(2, 8)]
+        batch_ids = [
+            self.create_receipt(partners[i], invoice_amount, amount)
+            for i, (invoice_amount, amount) in enumerate(amounts)]
+        single_ids = [
+            self.create_receipt(partners[i + 3], invoice_amount, amount)
+            for i, (invoice_amount, amount) in enumerate(amounts)]
+
+        stats = self.voucher_model.action_move_line_create_batch(
+            cr, uid, batch_ids)
+        self.assertEqual(stats['vouchers'], 3)
+        for voucher_id in single_ids:
+            self.voucher_model.signal_workflow(
+                cr, uid, [voucher_id], 'proforma_voucher')
+        self.assertEqual(
+            self._posting(batch_ids), self._posting(single_ids))
+
+    def test_workflow_after_moves(self):
+        cr, uid = self.cr, self.uid
+        voucher_id = self.create_receipt(
+            self.env.ref('base.res_partner_2').id, 100.0, 33.33)
+        self.voucher_model.action_move_line_create(cr, uid, [voucher_id])
+        voucher = self.voucher_model.browse(cr, uid, voucher_id)
+        move = voucher.move_id
+        lines = sorted(move.line_id.ids)
+        move_count = self.registry('account.move').search_count(cr, uid, [])
+        # moves are there: the workflow doesn't create them again
+        self.voucher_model.signal_workflow(
+            cr, uid, [voucher_id], 'proforma_voucher')
+        voucher.refresh()
+        self.assertEqual(voucher.state, 'posted')
+        self.assertEqual(voucher.move_id, move)
+        self.assertEqual(sorted(voucher.move_id.line_id.ids), lines)
+        self.assertEqual(
+            self.registry('account.move').search_count(cr, uid, []),
+            move_count)
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+#   See __openerp__.py about license
+#
+
+import random
+
+from openerp.tests.common import TransactionCase
+
+
+class TestSplitAmount(TransactionCase):
+
+    def setUp(self):
+        super(TestSplitAmount, self).setUp()
+        self.voucher_model = self.registry('account.voucher')
+        self.eur = self.env.ref('base.EUR')
+
+    def split(self, amount, weights):
+        return self.voucher_model._split_amount(
+            self.cr, self.uid, amount, weights, self.eur)
+
+    def test_split_equally(self):
+        self.assertEqual(self.split(100.0, [1, 1, 1]), [33.34, 33.33, 33.33])
+        self.assertEqual(
+            self.split(-100.0, [1, 1, 1]), [-33.34, -33.33, -33.33])
+
+    def test_split_proportionally(self):
+        self.assertEqual(self.split(10.0, [1000, 10, 0]), [9.90, 0.10, 0.0])
+        self.assertEqual(self.split(10.0, [0, 0]), [5.0, 5.0])
+
+    def test_split_is_exact(self):
+        rnd = random.Random(42)
+        weights = [rnd.uniform(1, 10000) for i in range(5000)]
+        parts = self.split(1234.57, weights)
+        self.assertEqual(len(parts), 5000)
+        self.assertAlmostEqual(sum(parts), 1234.57, places=6)
@@ -20,3 +20,4 @@
 ##############################################################################
 
 import voucher
+from .init_hook import pre_init_hook
@@ -37,6 +37,7 @@ This module adds the supplier invoice number to (Supplier Payment) voucher lines
         'test/purchase_payment.yml',
     ],
     "demo" : [],
+    'pre_init_hook': 'pre_init_hook',
     "active": False,
     "installable": False,
 }
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+##############################################################################
+#
+#    Copyright (C) 2013 Agile Business Group sagl
+#    (<http://www.agilebg.com>)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published
+#    by the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+##############################################################################
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+
+
+def pre_init_hook(cr):
+    """
+    Store the supplier invoice number of existing voucher lines by chunks,
+    instead of letting the ORM compute it for the whole voucher line table
+    at install time. Lines that don't pay an invoice are meant to stay
+    NULL: they have no supplier invoice number, and the ORM stores an
+    empty number as NULL too
+    """
+    store_field_supplier_invoice_number(cr)
+
+
+def store_field_supplier_invoice_number(cr):
+
+    cr.execute("""SELECT column_name
+    FROM information_schema.columns
+    WHERE table_name='account_voucher_line' AND
+    column_name='supplier_invoice_number'""")
+    if not cr.fetchone():
+        cr.execute(
+            """
+            ALTER TABLE account_voucher_line
+            ADD COLUMN supplier_invoice_number varchar(64);
+            COMMENT ON COLUMN account_voucher_line.supplier_invoice_number
+            IS 'Supplier Invoice Number';
+            """)
+
+    logger.info(
+        'Computing field supplier_invoice_number on account.voucher.line')
+
+    cr.execute("""
+        SELECT id FROM account_voucher_line
+        WHERE move_line_id IS NOT NULL ORDER BY id
+        """)
+    line_ids = [row[0] for row in cr.fetchall()]
+    for index in range(0, len(line_ids), CHUNK_SIZE):
+        chunk = line_ids[index:index + CHUNK_SIZE]
+        cr.execute(
+            """
+            UPDATE account_voucher_line vl
+            SET supplier_invoice_number = inv.supplier_invoice_number
+            FROM account_move_line l
+            JOIN account_invoice inv ON inv.move_id = l.move_id
+            WHERE l.id = vl.move_line_id AND vl.id IN %s
+            """, (tuple(chunk), ))
+        logger.info(
+            '%d/%d voucher lines computed',
+            min(index + CHUNK_SIZE, len(line_ids)), len(line_ids))
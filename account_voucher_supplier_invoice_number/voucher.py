@@ -25,22 +25,62 @@ from tools.translate import _
 class voucher_line(orm.Model):
     _inherit = 'account.voucher.line'
     
+    def get_suppl_inv_nums(self, cr, uid, move_line_ids, context=None):
+        """
+        Return {move_line_id: supplier invoice number}, read with one query
+        """
+        res = dict.fromkeys(move_line_ids, '')
+        if not move_line_ids:
+            return res
+        cr.execute("""
+            SELECT l.id, inv.supplier_invoice_number
+            FROM account_move_line l
+            JOIN account_invoice inv ON inv.move_id = l.move_id
+            WHERE l.id IN %s
+            """, (tuple(move_line_ids), ))
+        for move_line_id, number in cr.fetchall():
+            res[move_line_id] = number or ''
+        return res
+
     def get_suppl_inv_num(self, cr, uid, move_line_id, context=None):
-        move_line = self.pool.get('account.move.line').browse(cr, uid, move_line_id, context)
-        return (move_line.invoice and move_line.invoice.supplier_invoice_number or '')
+        return self.get_suppl_inv_nums(
+            cr, uid, [move_line_id], context=context)[move_line_id]
     
     def _get_supplier_invoice_number(self, cr, uid, ids, name, args, context=None):
-        res={}
-        for line in self.browse(cr, uid, ids, context):
-            res[line.id] = ''
-            if line.move_line_id:
-                res[line.id] = self.get_suppl_inv_num(cr, uid,
-                    line.move_line_id.id, context=context)
+        res = dict.fromkeys(ids, '')
+        lines = self.read(cr, uid, ids, ['move_line_id'], context=context)
+        numbers = self.get_suppl_inv_nums(cr, uid, [
+            line['move_line_id'][0] for line in lines
+            if line['move_line_id']], context=context)
+        for line in lines:
+            if line['move_line_id']:
+                res[line['id']] = numbers[line['move_line_id'][0]]
         return res
     
+    def _get_lines_from_self(self, cr, uid, ids, context=None):
+        return ids
+
+    def _get_lines_from_invoices(self, cr, uid, ids, context=None):
+        # self is account.invoice
+        cr.execute("""
+            SELECT vl.id
+            FROM account_voucher_line vl
+            JOIN account_move_line l ON l.id = vl.move_line_id
+            JOIN account_invoice inv ON inv.move_id = l.move_id
+            WHERE inv.id IN %s
+            """, (tuple(ids), ))
+        return [row[0] for row in cr.fetchall()]
+
     _columns = {
         'supplier_invoice_number': fields.function(_get_supplier_invoice_number,
-            type='char', size=64, string="Supplier Invoice Number"),
+            type='char', size=64, string="Supplier Invoice Number", select=True,
+            store={
+                'account.voucher.line': (
+                    _get_lines_from_self, ['move_line_id'], 10),
+                'account.invoice': (
+                    _get_lines_from_invoices,
+                    ['supplier_invoice_number', 'move_id'], 10),
+                }),
         }
 
 class voucher(orm.Model):
@@ -52,14 +92,15 @@ class voucher(orm.Model):
             journal_id, price,
             currency_id, ttype, date, context=context)
         line_obj = self.pool.get('account.voucher.line')
-        if res.get('value') and res['value'].get('line_cr_ids'):
-            for vals in res['value']['line_cr_ids']:
-                if vals.get('move_line_id'):
-                    vals['supplier_invoice_number'] = line_obj.get_suppl_inv_num(
-                        cr, uid, vals['move_line_id'], context=context)
-        if res.get('value') and res['value'].get('line_dr_ids'):
-            for vals in res['value']['line_dr_ids']:
-                if vals.get('move_line_id'):
-                    vals['supplier_invoice_number'] = line_obj.get_suppl_inv_num(
-                        cr, uid, vals['move_line_id'], context=context)
+        if res.get('value'):
+            lines = [
+                vals
+                for field in ('line_cr_ids', 'line_dr_ids')
+                for vals in res['value'].get(field) or []
+                if isinstance(vals, dict) and vals.get('move_line_id')
+                ]
+            numbers = line_obj.get_suppl_inv_nums(cr, uid, list(set(
+                vals['move_line_id'] for vals in lines)), context=context)
+            for vals in lines:
+                vals['supplier_invoice_number'] = numbers[vals['move_line_id']]
         return res